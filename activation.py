@@ -0,0 +1,112 @@
+import numpy as np
+
+from Building import Building
+from BuildingType import BuildingType
+from constants import activation_dict, major_establishments_tuple, primary_industry_dict, restaurants_tuple, \
+    secondary_industry_dict
+from game_state import N_BUILDINGS, building_index
+
+MAX_ROLL = 14
+
+WHEAT_INDICES = np.array([
+    building_index(building) for building, kind in primary_industry_dict.items() if kind == BuildingType.WHEAT
+])
+COW_INDICES = np.array([
+    building_index(building) for building, kind in primary_industry_dict.items() if kind == BuildingType.COW
+])
+GEAR_INDICES = np.array([
+    building_index(building) for building, kind in primary_industry_dict.items() if kind == BuildingType.GEAR
+])
+RESTAURANT_INDICES = np.array([building_index(building) for building in restaurants_tuple])
+# cards the publisher takes coins for
+PUBLISHER_INDICES = np.array(
+    [building_index(building) for building in restaurants_tuple]
+    + [building_index(building) for building, kind in secondary_industry_dict.items() if kind == BuildingType.BREAD]
+)
+SHOPPING_MALL = building_index(Building.SHOPPING_MALL)
+HARBOR = building_index(Building.HARBOR)
+SUSHI_BAR = building_index(Building.SUSHI_BAR)
+FLOWER_GARDEN = building_index(Building.FLOWER_GARDEN)
+RADIO_TOWER = building_index(Building.RADIO_TOWER)
+AIRPORT = building_index(Building.AIRPORT)
+AMUSEMENT_PARK = building_index(Building.AMUSEMENT_PARK)
+BUSINESS_CENTER = building_index(Building.BUSINESS_CENTER)
+TRAIN_STATION = building_index(Building.TRAIN_STATION)
+FRUIT_AND_VEGETABLE_MARKET = building_index(Building.FRUIT_AND_VEGETABLE_MARKET)
+CHEESE_FACTORY = building_index(Building.CHEESE_FACTORY)
+FURNITURE_FACTORY = building_index(Building.FURNITURE_FACTORY)
+FLOWER_SHOP = building_index(Building.FLOWER_SHOP)
+FOOD_WAREHOUSE = building_index(Building.FOOD_WAREHOUSE)
+TUNA_BOAT = building_index(Building.TUNA_BOAT)
+STADIUM = building_index(Building.STADIUM)
+TV_STATION = building_index(Building.TV_STATION)
+PUBLISHER = building_index(Building.PUBLISHER)
+TAX_OFFICE = building_index(Building.TAX_OFFICE)
+
+# card colors, in the order they are resolved
+RED = 0
+GREEN = 1
+BLUE = 2
+PURPLE = 3
+
+card_colors = {
+    **{building: RED for building in restaurants_tuple},
+    **{building: GREEN for building in secondary_industry_dict},
+    **{building: BLUE for building in primary_industry_dict},
+    **{building: PURPLE for building in major_establishments_tuple},
+}
+
+
+def _value_vectors(color: int, mall_bonus=lambda building: False) -> np.ndarray:
+    """
+    Builds the fixed payout of every card of one color for every roll.
+
+    Returns:
+        An int array of shape (2, MAX_ROLL + 1, N_BUILDINGS), indexed by
+        [has_shopping_mall, roll, building].
+    """
+    values = np.zeros((2, MAX_ROLL + 1, N_BUILDINGS), dtype=np.int32)
+    for building, activation in activation_dict.items():
+        if card_colors.get(building) != color or activation["value"] == "special":
+            continue
+        for roll in activation["roll"]:
+            values[:, roll, building_index(building)] = activation["value"]
+            if mall_bonus(building):
+                values[1, roll, building_index(building)] += 1
+    return values
+
+
+def _special_cards(color: int) -> tuple:
+    """For every roll, the cards of one color with a "special" payout, in resolution order."""
+    return tuple(
+        tuple(
+            building
+            for building in card_colors
+            if card_colors[building] == color
+            and activation_dict[building]["value"] == "special"
+            and roll in activation_dict[building]["roll"]
+        )
+        for roll in range(MAX_ROLL + 1)
+    )
+
+
+# fixed payouts: the coins a player gets from a roll are `holdings @ VALUES[has_mall, roll]`
+RED_VALUES = _value_vectors(RED, mall_bonus=lambda building: True)
+GREEN_VALUES = _value_vectors(
+    GREEN, mall_bonus=lambda building: secondary_industry_dict[building] == BuildingType.BREAD
+)
+BLUE_VALUES = _value_vectors(BLUE)[0]
+
+RED_SPECIAL = _special_cards(RED)
+GREEN_SPECIAL = _special_cards(GREEN)
+BLUE_SPECIAL = _special_cards(BLUE)
+# the business center needs a decision from the player, so it is resolved separately
+PURPLE_SPECIAL = tuple(
+    tuple(building for building in cards if building != Building.BUSINESS_CENTER)
+    for cards in _special_cards(PURPLE)
+)
+
+# ACTIVATION_MASK[roll, building] is True when the roll activates the building
+ACTIVATION_MASK = np.zeros((MAX_ROLL + 1, N_BUILDINGS), dtype=bool)
+for _building, _activation in activation_dict.items():
+    ACTIVATION_MASK[list(_activation["roll"]), building_index(_building)] = True
@@ -0,0 +1,246 @@
+import multiprocessing
+import queue
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from background_writer import close_background_writers
+from game import Game, make_players
+from game_record import close_writers
+from player_ai import freeze_models
+from shared_trunk import NumpyTrunkHead
+
+DEFAULT_PUBLISH_INTERVAL = 30.
+# trajectories waiting for the learner per actor; actors block beyond that
+QUEUE_SIZE_PER_ACTOR = 16
+# the version counter in front of the weights
+HEADER_SIZE = 8
+
+
+def weight_arrays(models):
+    """Returns the distinct weight arrays of `{player_id: {action: model}}` in a fixed order."""
+    arrays = []
+    seen = set()
+    for player_models in models.values():
+        for model in player_models.values():
+            for array in model.weights():
+                if id(array) not in seen:
+                    seen.add(id(array))
+                    arrays.append(array)
+    return arrays
+
+
+class WeightBroadcast(object):
+    """
+    Versioned model weights in shared memory, written by the learner and read by the actors.
+
+    The buffer holds a version counter followed by every weight array of the frozen models,
+    flattened in the order of `weight_arrays`. The writer makes the counter odd while it
+    copies and even when it is done, so a reader that sees the same even counter before and
+    after copying the buffer out holds one complete snapshot.
+    """
+
+    def __init__(self, models, name=None):
+        """
+        Args:
+            models: Frozen models by player id; they fix the layout. A reader's models are
+                overwritten in place by `poll`.
+            name: Name of the shared memory to attach to; None creates it.
+        """
+        self.arrays = weight_arrays(models)
+        size = sum(array.size for array in self.arrays)
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=HEADER_SIZE + 4 * size)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.counter = np.ndarray((1,), dtype=np.int64, buffer=self.memory.buf)
+        self.flat = np.ndarray((size,), dtype=np.float32, buffer=self.memory.buf, offset=HEADER_SIZE)
+        if self.owner:
+            self.counter[0] = 0
+            self.staging = None
+        else:
+            self.staging = np.empty(size, dtype=np.float32)
+        # number of publications of the weights held locally
+        self.version = 0
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def publish(self, models):
+        """Writes the weights of frozen models laid out like the ones the broadcast was created with."""
+        self.counter[0] += 1
+        offset = 0
+        for array in weight_arrays(models):
+            self.flat[offset:offset + array.size] = array.ravel()
+            offset += array.size
+        self.counter[0] += 1
+        self.version = int(self.counter[0]) // 2
+
+    def poll(self):
+        """Copies newer weights into the models, if there are any. Returns whether they changed."""
+        counter = int(self.counter[0])
+        if counter % 2 or counter // 2 == self.version:
+            return False
+        np.copyto(self.staging, self.flat)
+        if int(self.counter[0]) != counter:
+            # overwritten while copying; the next poll gets the new weights
+            return False
+        offset = 0
+        for array in self.arrays:
+            array[...] = self.staging[offset:offset + array.size].reshape(array.shape)
+            offset += array.size
+        self.version = counter // 2
+        return True
+
+    def close(self):
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def run_actor(task):
+    """
+    Plays self-play games until told to stop, in an actor process.
+
+    Before every game the actor picks up the latest broadcast weights. After it, the
+    players' decisions are put on the trajectory queue together with the weights version
+    they were played with and the number of turns.
+
+    Args:
+        task: The actor's index, the number of actors, the frozen models of every player id,
+            the name of the weight broadcast, the trajectory queue, the stop event and the
+            game options.
+    """
+    actor_id, n_actors, models, broadcast_name, trajectories, stop, options = task
+    players = make_players(len(models), models, options)
+    weights = WeightBroadcast(models, broadcast_name)
+    n_played = 0
+    while not stop.is_set():
+        if weights.poll():
+            for player_models in models.values():
+                for model in player_models.values():
+                    if isinstance(model, NumpyTrunkHead):
+                        model.trunk.clear_cache()
+            for player in players:
+                if player.AI.cache is not None:
+                    player.AI.cache.clear()
+        # game ids of different actors never collide
+        game = Game(len(players), players, options=options, game_id=1 + actor_id + n_actors * n_played)
+        game.run(silent=True)
+        n_played += 1
+        trajectories.put((weights.version, game.turn, {player.id: player.export_history() for player in players}))
+        for player in players:
+            player.AI.replay.clear()
+    close_writers()
+    close_background_writers()
+    weights.close()
+
+
+def learn(players, options, n_actors, n_games, train_every=50, save_every=500,
+          publish_interval=DEFAULT_PUBLISH_INTERVAL, max_policy_lag=None, save=None):
+    """
+    Runs self-play as an actor-learner loop: `n_actors` processes play continuously while
+    this process merges their decisions into `players` and trains on them.
+
+    Training runs in the background (see `PlayerAI.start_training`) every `train_every`
+    games, so the learner keeps draining the queue while it fits. Every `publish_interval`
+    seconds the weights published by training since are broadcast to the actors, which
+    pick them up before their next game.
+
+    Args:
+        players: The players whose AI learns, as in the synchronous loop.
+        options: The game options.
+        n_actors: Number of actor processes playing games.
+        n_games: Number of games to play in total.
+        train_every: Number of games after which training on the decisions so far is started.
+        save_every: Number of games after which the players' histories are flushed and `save` is called.
+        publish_interval: Seconds between broadcasts of newly trained weights to the actors;
+            also how long the learner waits for a game before checking for new weights.
+        max_policy_lag: Games played with weights more than this many broadcasts old are not
+            trained on; None trains on every game.
+        save: Function saving the models.
+
+    Returns:
+        The number of turns of every game, in the order they arrived.
+    """
+    ai_players = [player for player in players if player.agent.uses_ai]
+    players_by_id = {player.id: player for player in players}
+    context = multiprocessing.get_context('spawn')
+    models = freeze_models(players)
+    weights = WeightBroadcast(models)
+    weights.publish(models)
+    trajectories = context.Queue(QUEUE_SIZE_PER_ACTOR * n_actors)
+    stop = context.Event()
+    actors = [
+        context.Process(target=run_actor, args=((i, n_actors, models, weights.name, trajectories, stop, options),),
+                        daemon=True)
+        for i in range(n_actors)
+    ]
+    for actor in actors:
+        actor.start()
+
+    turns = []
+    lags = []
+    n_dropped = 0
+    # publications of the trainers at the last broadcast
+    broadcast_stamp = None
+    last_broadcast = time.monotonic()
+    start = time.monotonic()
+    try:
+        while len(turns) < n_games:
+            try:
+                version, game_turns, histories = trajectories.get(timeout=publish_interval)
+            except queue.Empty:
+                version = None
+            if version is not None:
+                turns.append(game_turns)
+                lag = weights.version - version
+                if max_policy_lag is None or lag <= max_policy_lag:
+                    lags.append(lag)
+                    for player_id, history in histories.items():
+                        players_by_id[player_id].merge_history(history)
+                    if players[0].shared_ai:
+                        players[0].AI.shared.absorb(players)
+                else:
+                    n_dropped += 1
+                if len(turns) % train_every == 0:
+                    for player in ai_players:
+                        player.train_ai(background=True)
+                if len(turns) % save_every == 0:
+                    for player in ai_players:
+                        player.AI.wait_training()
+                    for player in players:
+                        player.flush_history()
+                    if save is not None:
+                        save()
+                    cycle = turns[-save_every:]
+                    print(f'{len(turns)} games at {len(turns) / (time.monotonic() - start):.1f} games/s, '
+                          f'mean turns {np.mean(cycle)}, sd: {np.std(cycle)}, weights version {weights.version}, '
+                          f'mean policy lag {np.mean(lags) if lags else 0.:.2f}, dropped {n_dropped}')
+                    sys.stdout.flush()
+                    lags = []
+            if time.monotonic() - last_broadcast >= publish_interval:
+                stamp = [player.AI.trainer and player.AI.trainer.published for player in ai_players]
+                if stamp != broadcast_stamp:
+                    weights.publish(freeze_models(players))
+                    broadcast_stamp = stamp
+                last_broadcast = time.monotonic()
+    finally:
+        stop.set()
+        # actors may be blocked on a full queue
+        while any(actor.is_alive() for actor in actors):
+            try:
+                trajectories.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for actor in actors:
+            actor.join()
+        weights.close()
+        # the last training publishes its weights before the models are used or saved
+        for player in ai_players:
+            player.AI.wait_training()
+    return turns
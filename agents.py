@@ -0,0 +1,239 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from Building import Building
+from game_state import BUILDING_ORDER, BUILDING_COST_VECTOR, LANDMARK_INDICES, N_BUILDINGS, building_index
+from income_tables import ROLL_PROBABILITIES, income_moments, purchase_scores, turn_income
+from planner import RolloutPlanner
+from player import choose_from_probs
+from turn_outcomes import turn_outcomes
+
+# candidate rows appended to the game state for each decision of a NeuralAgent
+DICE_OPTIONS = np.array([[1.], [0.]])
+BUY_OPTIONS = np.eye(N_BUILDINGS)
+
+
+class Agent(ABC):
+    """
+    Makes a player's decisions. `Player` checks that a decision is possible before asking
+    its agent, so every method is only called with at least one legal choice.
+    """
+    # whether the player's PlayerAI models are needed
+    uses_ai = False
+
+    @abstractmethod
+    def decide_dice(self, player):
+        """
+        Only called when the player owns the train station.
+
+        Returns:
+            The number of dice to roll, 1 or 2.
+        """
+
+    @abstractmethod
+    def decide_reroll(self, player, roll, num_dice):
+        """
+        Only called when the player owns the radio tower.
+
+        Returns:
+            Whether to reroll.
+        """
+
+    @abstractmethod
+    def decide_target_tv_station(self, player):
+        """
+        Returns:
+            The id of the player to take coins from.
+        """
+
+    @abstractmethod
+    def decide_target_business_center(self, player):
+        """
+        Only called when `player.swap_mask` has a legal trade.
+
+        Returns:
+            The id of the player to trade with, the building to take from them and the building
+            to give them (see `Player.decode_swap`), or None to skip the trade.
+        """
+
+    @abstractmethod
+    def decide_purchase(self, player, possible_purchases):
+        """
+        Returns:
+            The building to buy, one of `possible_purchases`.
+        """
+
+
+class NeuralAgent(Agent):
+    """
+    Decides with the player's PlayerAI models and records every decision for training.
+    """
+    uses_ai = True
+
+    def decide_dice(self, player):
+        probs = player.AI.eval_action('dice', DICE_OPTIONS)
+        choice = choose_from_probs(probs, rng=player.game.rng.ai, game=player.game)
+        player.AI.record_action('dice', DICE_OPTIONS[choice:choice + 1])
+        if choice == 0:
+            return 2
+        else:
+            return 1
+
+    def decide_reroll(self, player, roll, num_dice):
+        extra_input = np.zeros((2, 2 + 12))
+        extra_input[0, 0] = 1
+        extra_input[:, 1] = num_dice == 2
+        extra_input[:, 1 + roll] = 1
+        probs = player.AI.eval_action('reroll', extra_input)
+        choice = choose_from_probs(probs, rng=player.game.rng.ai, game=player.game)
+        player.AI.record_action('reroll', extra_input[choice:choice + 1])
+        return choice == 0
+
+    def decide_target_tv_station(self, player):
+        extra_input = np.eye(player.game.n_players - 1)
+        probs = player.AI.eval_action('steal', extra_input)
+        choice = choose_from_probs(probs, rng=player.game.rng.ai, game=player.game)
+        player.AI.record_action('steal', extra_input[choice:choice + 1])
+        return player.get_next_player(player.opponent_offsets()[choice]).order
+
+    def decide_target_business_center(self, player):
+        # only the legal trades are scored; the rest keep probability 0 and are masked anyway
+        legal = np.flatnonzero(player.swap_mask)
+        candidates = player.AI.swap_candidates(legal)
+        probs = np.zeros(len(player.swap_mask))
+        probs[legal] = player.AI.eval_action('swap', candidates)
+        choice = choose_from_probs(probs, constraint_mask=player.swap_mask, rng=player.game.rng.business_center,
+                                   game=player.game)
+        row = np.searchsorted(legal, choice)
+        player.AI.record_action('swap', candidates[row:row + 1])
+        return player.decode_swap(choice)
+
+    def decide_purchase(self, player, possible_purchases):
+        buy_mask = np.zeros(N_BUILDINGS)
+        buy_mask[[building_index(building) for building in possible_purchases]] = 1
+        probs = player.AI.eval_action('buy', BUY_OPTIONS)
+        choice = choose_from_probs(probs, constraint_mask=buy_mask, rng=player.game.rng.ai, game=player.game)
+        player.AI.record_action('buy', BUY_OPTIONS[choice:choice + 1])
+        return BUILDING_ORDER[choice]
+
+
+class RandomAgent(Agent):
+    """Picks uniformly among the legal choices, drawing from the game's decision stream."""
+
+    def decide_dice(self, player):
+        return int(player.game.rng.ai.integers(1, 3))
+
+    def decide_reroll(self, player, roll, num_dice):
+        return bool(player.game.rng.ai.integers(2))
+
+    def decide_target_tv_station(self, player):
+        return player.get_next_player(int(player.game.rng.ai.integers(1, player.game.n_players))).order
+
+    def decide_target_business_center(self, player):
+        legal = np.flatnonzero(player.swap_mask)
+        return player.decode_swap(int(player.game.rng.business_center.choice(legal)))
+
+    def decide_purchase(self, player, possible_purchases):
+        return possible_purchases[int(player.game.rng.ai.integers(len(possible_purchases)))]
+
+
+class GreedyAgent(Agent):
+    """
+    Rule-based baseline built on the exact income tables: buys the most expensive
+    affordable landmark, otherwise the establishment with the best expected income per coin.
+    """
+
+    def decide_dice(self, player):
+        income = turn_income(player.buildings.row, player.game.n_players)
+        return 2 if ROLL_PROBABILITIES[2] @ income > ROLL_PROBABILITIES[1] @ income else 1
+
+    def decide_reroll(self, player, roll, num_dice):
+        income = turn_income(player.buildings.row, player.game.n_players)
+        return income[roll] < ROLL_PROBABILITIES[num_dice] @ income
+
+    def decide_target_tv_station(self, player):
+        coins = player.state.coins
+        opponents = [player.get_next_player(offset).order for offset in range(1, player.game.n_players)]
+        return max(opponents, key=lambda player_id: coins[player_id])
+
+    def decide_target_business_center(self, player):
+        num_dice = 2 if player.buildings[Building.TRAIN_STATION] else 1
+        mean, _ = income_moments(player.buildings.row, player.game.n_players, num_dice)
+        best, best_gain = None, 0.
+        for choice in np.flatnonzero(player.swap_mask):
+            swap = player.decode_swap(choice)
+            gain = mean[building_index(swap[1])] - mean[building_index(swap[2])]
+            if gain > best_gain:
+                best, best_gain = swap, gain
+        return best
+
+    def decide_purchase(self, player, possible_purchases):
+        return self.rank_purchases(player, possible_purchases)[0]
+
+    def rank_purchases(self, player, possible_purchases):
+        """Orders the purchases best first: landmarks by cost, then establishments by income per coin."""
+        indices = np.array([building_index(building) for building in possible_purchases])
+        num_dice = 2 if player.buildings[Building.TRAIN_STATION] else 1
+        scores = purchase_scores(player.buildings.row, player.game.n_players, num_dice)
+        is_landmark = np.isin(indices, LANDMARK_INDICES)
+        # landmarks first, most expensive first; lexsort sorts by its last key first
+        order = np.lexsort((-scores[indices], -BUILDING_COST_VECTOR[indices] * is_landmark, ~is_landmark))
+        return [BUILDING_ORDER[i] for i in indices[order]]
+
+
+class PlannerAgent(GreedyAgent):
+    """Chooses purchases with Monte Carlo rollouts (see `planner.RolloutPlanner`); decides the rest greedily."""
+
+    def __init__(self, **planner_options):
+        self.planner = RolloutPlanner(**planner_options)
+
+    def decide_purchase(self, player, possible_purchases):
+        return self.planner.plan(player.game, player.order, self.rank_purchases(player, possible_purchases))
+
+
+class ExactRollsAgent(NeuralAgent):
+    """
+    Decides with the PlayerAI models, except for the dice and the reroll: those maximize the
+    expected gain of the exact turn outcomes (see `turn_outcomes`), which takes a fixed dozen
+    activations instead of a network call. The dice and reroll models get no training data.
+    """
+
+    def __init__(self):
+        # outcomes of the last (game, turn), shared by the dice and reroll decisions of a turn;
+        # keyed on the game itself, as a later game can reuse a collected game's id
+        self.outcomes_key = (None, None)
+        self.outcomes = None
+
+    def roll_values(self, player):
+        game, turn = self.outcomes_key
+        if game is not player.game or turn != player.game.current_turn:
+            self.outcomes_key = (player.game, player.game.current_turn)
+            self.outcomes = turn_outcomes(player.game, player.order)
+        return self.outcomes.roll_values(player.order)
+
+    def decide_dice(self, player):
+        values = self.roll_values(player)
+        return 2 if ROLL_PROBABILITIES[2] @ values > ROLL_PROBABILITIES[1] @ values else 1
+
+    def decide_reroll(self, player, roll, num_dice):
+        values = self.roll_values(player)
+        return values[roll] < ROLL_PROBABILITIES[num_dice] @ values
+
+
+AGENTS = {
+    'neural': NeuralAgent,
+    'neural_exact_rolls': ExactRollsAgent,
+    'random': RandomAgent,
+    'greedy': GreedyAgent,
+    'planner': PlannerAgent,
+}
+
+
+def make_agent(name, options=None):
+    """
+    Args:
+        name: Key of `AGENTS`.
+        options: Keyword arguments of the agent, e.g. of the planner.
+    """
+    return AGENTS[name](**(options or {}))
@@ -0,0 +1,111 @@
+import threading
+
+import numpy as np
+
+from numpy_model import NumpyModel
+
+DEFAULT_EPOCHS = 10
+DEFAULT_BATCH_SIZE = 100
+
+
+def make_dataset(features, labels, batch_size=DEFAULT_BATCH_SIZE, state_dim=None):
+    """
+    Builds a shuffled, batched and prefetched `tf.data` pipeline of decisions with one-hot
+    win labels, reshuffled every epoch.
+
+    Args:
+        state_dim: If given, every batch is split into the state columns and the extra
+            columns, the inputs of a shared-trunk training model.
+    """
+    import tensorflow as tf
+
+    def prepare(x, y):
+        if state_dim is not None:
+            x = (x[:, :state_dim], x[:, state_dim:])
+        return x, tf.one_hot(y, 2)
+
+    return (
+        tf.data.Dataset.from_tensor_slices((features, labels.astype(np.int32)))
+        .shuffle(len(labels), reshuffle_each_iteration=True)
+        .batch(batch_size)
+        .map(prepare, num_parallel_calls=tf.data.AUTOTUNE)
+        .prefetch(tf.data.AUTOTUNE)
+    )
+
+
+class BackgroundTrainer(object):
+    """
+    Trains a PlayerAI's models in a background thread while self-play goes on.
+
+    The Keras models the AI had when the trainer was created become the trainer's
+    `learners`; the AI plays with NumPy copies of them from then on. `start` snapshots the
+    replay store and fits every action's learner on it in the thread. When a fit finishes
+    its weights are copied and swapped into the AI's models in one assignment per action,
+    so a decision never sees half-updated weights, and the evaluation cache is invalidated.
+    The copies of one fit are swapped in under `lock`, which `PlayerAI.frozen_models` also
+    holds, so a snapshot never mixes heads of two shared-trunk encoders.
+    """
+
+    def __init__(self, ai, epochs=DEFAULT_EPOCHS, batch_size=DEFAULT_BATCH_SIZE):
+        self.ai = ai
+        self.epochs = epochs
+        self.batch_size = batch_size
+        self.learners = dict(ai.models)
+        self.thread = None
+        self.error = None
+        self.lock = threading.Lock()
+        # number of publications, to tell whether the AI's models changed
+        self.published = 0
+        self.publish(ai.models)
+
+    def start(self, replay, actions):
+        """Waits for the previous training, then trains on a copy of the replay store's decisions."""
+        self.wait()
+        # self-play keeps writing into the store's ring buffers while the thread trains, so
+        # the thread can't stream from them
+        data = {}
+        for action in actions:
+            features, labels, _ = replay.buffers[action].data()
+            if features is not None and len(features):
+                data[action] = (features.copy(), labels.copy())
+        self.thread = threading.Thread(target=self._run, args=(data,), daemon=True)
+        self.thread.start()
+
+    def wait(self):
+        """Blocks until the current training is done and re-raises its error, if any."""
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def publish(self, actions):
+        network = self.ai.network
+        if network is not None:
+            # the heads share the encoder, so all of them change with every fit
+            published = network.to_numpy()
+        else:
+            published = {action: NumpyModel.from_keras(self.learners[action]) for action in actions}
+        with self.lock:
+            for action, model in published.items():
+                self.ai.models[action] = model
+            self.published += 1
+        if self.ai.cache is not None:
+            self.ai.cache.invalidate()
+
+    def _run(self, data):
+        network = self.ai.network
+        try:
+            for action, (features, labels) in data.items():
+                if network is not None:
+                    learner = network.train_models[action]
+                    dataset = make_dataset(features, labels, self.batch_size, network.state_dim)
+                else:
+                    learner = self.learners[action]
+                    dataset = make_dataset(features, labels, self.batch_size)
+                # the dataset is shuffled already
+                learner.fit(dataset, epochs=self.epochs, shuffle=False, verbose=0)
+                self.publish([action])
+        except Exception as error:
+            self.error = error
@@ -0,0 +1,80 @@
+import atexit
+import queue
+import threading
+import time
+
+DEFAULT_QUEUE_SIZE = 1024
+DEFAULT_FLUSH_SIZE = 1 << 20
+DEFAULT_FLUSH_INTERVAL = 5.
+
+
+class BackgroundWriter(object):
+    """
+    Appends text to a file from a background thread.
+
+    `write` only puts the text on a bounded queue (blocking if the thread falls behind).
+    The thread joins queued texts in memory and writes them with one call once
+    `flush_size` characters are buffered or `flush_interval` seconds have passed. The
+    file stays open until `close`.
+    """
+
+    def __init__(self, filename, queue_size=DEFAULT_QUEUE_SIZE, flush_size=DEFAULT_FLUSH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.file = open(filename, 'a')
+        self.queue = queue.Queue(queue_size)
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, text):
+        self.queue.put(text)
+
+    def close(self):
+        """Writes everything queued so far and closes the file."""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+
+    def _run(self):
+        buffer = []
+        buffered = 0
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(self.flush_interval - (time.monotonic() - last_flush), 0.)
+            try:
+                text = self.queue.get(timeout=timeout) if buffer else self.queue.get()
+            except queue.Empty:
+                text = ''
+            if text is not None:
+                buffer.append(text)
+                buffered += len(text)
+            if text is None or buffered >= self.flush_size or time.monotonic() - last_flush >= self.flush_interval:
+                if buffer:
+                    self.file.write(''.join(buffer))
+                    self.file.flush()
+                buffer = []
+                buffered = 0
+                last_flush = time.monotonic()
+            if text is None:
+                return
+
+
+# one writer per file and process, shared by every game the process plays
+_writers = {}
+
+
+def open_background_writer(filename):
+    if filename not in _writers or _writers[filename].closed:
+        _writers[filename] = BackgroundWriter(filename)
+    return _writers[filename]
+
+
+@atexit.register
+def close_background_writers():
+    for writer in _writers.values():
+        writer.close()
@@ -0,0 +1,253 @@
+import numpy as np
+
+from activation import ACTIVATION_MASK, RED_VALUES, GREEN_VALUES, BLUE_VALUES, WHEAT_INDICES, COW_INDICES, \
+    GEAR_INDICES, RESTAURANT_INDICES, PUBLISHER_INDICES, SHOPPING_MALL, HARBOR, SUSHI_BAR, FLOWER_GARDEN, \
+    RADIO_TOWER, AIRPORT, AMUSEMENT_PARK, BUSINESS_CENTER, TRAIN_STATION, FRUIT_AND_VEGETABLE_MARKET, \
+    CHEESE_FACTORY, FURNITURE_FACTORY, FLOWER_SHOP, FOOD_WAREHOUSE, TUNA_BOAT, STADIUM, TV_STATION, PUBLISHER, \
+    TAX_OFFICE
+from constants import starting_buildings, tradeable_establishments_tuple
+from game_state import N_BUILDINGS, BUILDING_COST_VECTOR, PLAYER_LIMIT_VECTOR, LANDMARK_INDICES, \
+    building_index, buildings_to_vector, initial_market
+
+TRADEABLE = np.zeros(N_BUILDINGS, dtype=bool)
+TRADEABLE[[building_index(building) for building in tradeable_establishments_tuple]] = True
+
+
+def decide_dice(game, games, players):
+    """Rolls two dice whenever the player owns a train station."""
+    return 1 + (game.buildings[games, players, TRAIN_STATION] > 0)
+
+
+def decide_reroll(game, games, players, rolls):
+    """Never rerolls."""
+    return np.zeros(len(games), dtype=bool)
+
+
+def decide_purchase(game, games, players, can_buy):
+    """Buys a uniformly random affordable card; returns -1 where nothing can be bought."""
+    keys = game.rng.random(can_buy.shape) * can_buy
+    return np.where(can_buy.any(axis=1), np.argmax(keys, axis=1), -1)
+
+
+def decide_target(game, games, players):
+    """Targets the opponent with the most coins."""
+    coins = game.coins[games].astype(np.int64)
+    coins[np.arange(len(games)), players] = -1
+    return np.argmax(coins, axis=1)
+
+
+class BatchedGame(object):
+    """
+    Advances many independent games in lockstep.
+
+    Every game's holdings live in one `(n_games, n_players, N_BUILDINGS)` array and every
+    step of a turn (dice, card activation, city hall, purchase, airport) is applied to all
+    running games at once. The rules follow `Game.take_turn`. Decisions are made by
+    vectorized policies that receive the running game indices and the current player of each.
+    Finished games are replaced with new ones until the requested number of games is played.
+    """
+
+    def __init__(self, n_games: int, n_players: int = 4, seed=None, policies=None):
+        """
+        Args:
+            n_games: Number of games advanced together.
+            n_players: Number of players in every game.
+            seed: Seed for the dice and the default policies.
+            policies: Optional dict overriding any of the 'dice', 'reroll', 'purchase',
+                'tv_station' and 'business_center' decisions.
+        """
+        self.n_games = n_games
+        self.n_players = n_players
+        self.rng = np.random.default_rng(seed)
+        self.policies = {
+            'dice': decide_dice,
+            'reroll': decide_reroll,
+            'purchase': decide_purchase,
+            'tv_station': decide_target,
+            'business_center': decide_target,
+            **(policies or {}),
+        }
+        self.buildings = np.zeros((n_games, n_players, N_BUILDINGS), dtype=np.int8)
+        self.coins = np.zeros((n_games, n_players), dtype=np.int32)
+        self.market = np.zeros((n_games, N_BUILDINGS), dtype=np.int8)
+        self.current_player = np.zeros(n_games, dtype=np.intp)
+        self.turn = np.zeros(n_games, dtype=np.int32)
+        self.is_first_turn = np.ones((n_games, n_players), dtype=bool)
+        self.active = np.zeros(n_games, dtype=bool)
+        self.games_to_start = 0
+        self.winners = []
+        self.turns = []
+
+    def reset_games(self, games):
+        """Starts a new game in each of the given slots."""
+        self.buildings[games] = buildings_to_vector(starting_buildings)
+        self.coins[games] = 0
+        self.market[games] = initial_market(self.n_players)
+        self.current_player[games] = 0
+        self.turn[games] = 0
+        self.is_first_turn[games] = True
+        self.active[games] = True
+        self.games_to_start -= len(games)
+
+    def roll_dice(self, num_dice):
+        """Rolls one or two dice for every game at once."""
+        dice = self.rng.integers(1, 7, size=(len(num_dice), 2))
+        dice[:, 1] *= (num_dice == 2)
+        return dice.sum(axis=1), dice[:, 0] == dice[:, 1]
+
+    def take_from(self, games, takers, victims, coins_to_take):
+        """Moves up to `coins_to_take` coins from each victim to the matching taker."""
+        coins_to_take = np.minimum(coins_to_take, self.coins[games, victims])
+        self.coins[games, victims] -= coins_to_take
+        self.coins[games, takers] += coins_to_take
+
+    def activate_cards(self, games, players, rolls):
+        """Activate cards based on dice roll, for every running game."""
+        buildings = self.buildings
+        n_players = self.n_players
+        active = ACTIVATION_MASK[rolls]
+        has_shopping_mall = (buildings[games, :, SHOPPING_MALL] > 0).astype(np.intp)
+
+        # red goes first
+        for offset in range(1, n_players):
+            owners = (players - offset) % n_players
+            held = buildings[games, owners].astype(np.int32)
+            mall = has_shopping_mall[np.arange(len(games)), owners]
+            coins_to_take = np.einsum('gb,gb->g', held, RED_VALUES[mall, rolls])
+            coins_to_take += active[:, SUSHI_BAR] * (3 + mall) * (held[:, HARBOR] > 0) * held[:, SUSHI_BAR]
+            self.take_from(games, owners, players, coins_to_take)
+
+        # green only pays the current player
+        held = buildings[games, players].astype(np.int32)
+        mall = has_shopping_mall[np.arange(len(games)), players]
+        coins_to_gain = np.einsum('gb,gb->g', held, GREEN_VALUES[mall, rolls])
+        coins_to_gain += (active[:, FRUIT_AND_VEGETABLE_MARKET] * 2 * held[:, WHEAT_INDICES].sum(axis=1)
+                          * held[:, FRUIT_AND_VEGETABLE_MARKET])
+        coins_to_gain += active[:, CHEESE_FACTORY] * 3 * held[:, COW_INDICES].sum(axis=1) * held[:, CHEESE_FACTORY]
+        coins_to_gain += (active[:, FURNITURE_FACTORY] * 3 * held[:, GEAR_INDICES].sum(axis=1)
+                          * held[:, FURNITURE_FACTORY])
+        coins_to_gain += active[:, FLOWER_SHOP] * held[:, FLOWER_GARDEN] * held[:, FLOWER_SHOP]
+        coins_to_gain += (active[:, FOOD_WAREHOUSE] * 2 * held[:, RESTAURANT_INDICES].sum(axis=1)
+                          * held[:, FOOD_WAREHOUSE])
+        self.coins[games, players] += coins_to_gain
+
+        # blue goes next
+        everyone = buildings[games].astype(np.int32)
+        coins_to_gain = np.einsum('gpb,gb->gp', everyone, BLUE_VALUES[rolls])
+        tuna_rolls = self.rng.integers(1, 7, size=(len(games), n_players, 2)).sum(axis=2)
+        coins_to_gain += active[:, TUNA_BOAT, None] * everyone[:, :, TUNA_BOAT] * tuna_rolls
+        self.coins[games] += coins_to_gain
+
+        # purple goes last
+        owns = active & (held > 0)
+        if owns[:, STADIUM].any():
+            g, p = games[owns[:, STADIUM]], players[owns[:, STADIUM]]
+            for offset in range(1, n_players):
+                self.take_from(g, p, (p - offset) % n_players, 2)
+        if owns[:, TV_STATION].any():
+            g, p = games[owns[:, TV_STATION]], players[owns[:, TV_STATION]]
+            self.take_from(g, p, self.policies['tv_station'](self, g, p), 5)
+        if owns[:, PUBLISHER].any():
+            g, p = games[owns[:, PUBLISHER]], players[owns[:, PUBLISHER]]
+            for offset in range(1, n_players):
+                victims = (p - offset) % n_players
+                self.take_from(g, p, victims, buildings[g, victims][:, PUBLISHER_INDICES].sum(axis=1))
+        if owns[:, TAX_OFFICE].any():
+            g, p = games[owns[:, TAX_OFFICE]], players[owns[:, TAX_OFFICE]]
+            for offset in range(1, n_players):
+                victims = (p - offset) % n_players
+                victim_coins = self.coins[g, victims]
+                self.take_from(g, p, victims, np.where(victim_coins >= 10, victim_coins // 2, 0))
+        if owns[:, BUSINESS_CENTER].any():
+            g, p = games[owns[:, BUSINESS_CENTER]], players[owns[:, BUSINESS_CENTER]]
+            self.swap_random_buildings(g, p, self.policies['business_center'](self, g, p))
+
+    def swap_random_buildings(self, games, players, targets):
+        """Business center: trades a random establishment of the target for a random establishment of the player."""
+        buildings = self.buildings
+        their_options = (buildings[games, targets] > 0) & TRADEABLE
+        own_options = (buildings[games, players] > 0) & TRADEABLE
+        possible = their_options.any(axis=1) & own_options.any(axis=1)
+        games, players, targets = games[possible], players[possible], targets[possible]
+        taken = np.argmax(self.rng.random(their_options.shape) * their_options, axis=1)[possible]
+        given = np.argmax(self.rng.random(own_options.shape) * own_options, axis=1)[possible]
+        buildings[games, targets, taken] -= 1
+        buildings[games, players, taken] += 1
+        buildings[games, players, given] -= 1
+        buildings[games, targets, given] += 1
+
+    def step(self):
+        """Plays one turn in every running game."""
+        games = np.flatnonzero(self.active)
+        players = self.current_player[games]
+        buildings = self.buildings
+        coins = self.coins
+        self.turn[games] += 1
+
+        # Step 1: Roll Dice; nobody rolls on their first turn
+        num_dice = self.policies['dice'](self, games, players)
+        rolls, is_double = self.roll_dice(num_dice)
+
+        # Step 2: player can choose to reroll if they have radio tower
+        reroll = (buildings[games, players, RADIO_TOWER] > 0) & self.policies['reroll'](self, games, players, rolls)
+        if reroll.any():
+            rolls[reroll], is_double[reroll] = self.roll_dice(num_dice[reroll])
+        rolling = ~self.is_first_turn[games, players]
+        rolls *= rolling
+        is_double &= rolling
+
+        # Step 3: Activate Cards
+        self.activate_cards(games, players, rolls)
+        self.is_first_turn[games, players] = False
+
+        # Step 4: city hall gives a coin if active player does not have any
+        coins[games, players] = np.maximum(coins[games, players], 1)
+
+        # Step 5: Buy a card
+        can_buy = (
+                (self.market[games] > 0)
+                & (BUILDING_COST_VECTOR <= coins[games, players][:, None])
+                & (buildings[games, players] < PLAYER_LIMIT_VECTOR)
+        )
+        purchases = self.policies['purchase'](self, games, players, can_buy)
+        has_built = purchases >= 0
+        g, p, purchase = games[has_built], players[has_built], purchases[has_built]
+        self.market[g, purchase] -= 1
+        coins[g, p] -= BUILDING_COST_VECTOR[purchase]
+        buildings[g, p, purchase] += 1
+
+        # Step 7: airport trigger
+        airport = ~has_built & (buildings[games, players, AIRPORT] > 0)
+        coins[games[airport], players[airport]] += 10
+
+        extra_turn = is_double & (buildings[games, players, AMUSEMENT_PARK] > 0)
+        self.current_player[games] = np.where(extra_turn, players, (players + 1) % self.n_players)
+        self.finish_games(games)
+
+    def finish_games(self, games):
+        """Records finished games and replaces them while there are games left to play."""
+        has_all_landmarks = self.buildings[games][:, :, LANDMARK_INDICES].all(axis=2)
+        finished = has_all_landmarks.any(axis=1)
+        if not finished.any():
+            return
+        finished_games = games[finished]
+        self.winners.append(np.argmax(has_all_landmarks[finished], axis=1))
+        self.turns.append(self.turn[finished_games].copy())
+        self.active[finished_games] = False
+        self.reset_games(finished_games[:max(self.games_to_start, 0)])
+
+    def play(self, n_games: int):
+        """
+        Plays `n_games` games, keeping the batch full until fewer games than slots remain.
+
+        Returns:
+            The winning seat and the number of turns of every game, in order of completion.
+        """
+        self.winners = []
+        self.turns = []
+        self.active[:] = False
+        self.games_to_start = n_games
+        self.reset_games(np.arange(min(self.n_games, n_games)))
+        while self.active.any():
+            self.step()
+        return np.concatenate(self.winners), np.concatenate(self.turns)
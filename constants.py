@@ -121,6 +121,13 @@ restaurants_tuple = (
     Building.HAMBURGER_STAND,
 )
 
+# establishments the business center can trade
+tradeable_establishments_tuple = (
+        tuple(primary_industry_dict.keys())
+        + tuple(secondary_industry_dict.keys())
+        + restaurants_tuple
+)
+
 player_limit = {landmark: 1 for landmark in landmarks_tuple}
 player_limit = {
     **player_limit,
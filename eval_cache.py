@@ -0,0 +1,78 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_SIZE = 100000
+
+
+def state_digest(array):
+    return hashlib.blake2b(array.tobytes(), digest_size=16).digest()
+
+
+class EvalCache(object):
+    """
+    LRU cache of evaluated decisions.
+
+    Keys combine the action, a digest of the serialized game state and digests of the
+    candidate rows, so a position seen again (e.g. the opening turns of every self-play
+    game) skips the network. Values are the read-only win probabilities of the candidates.
+    The owner clears the cache whenever the model weights change; a thread swapping in new
+    weights calls `invalidate` instead, and the cache is cleared by its next lookup. Lookups
+    and insertions hold a lock, so games running in several threads can share one cache.
+    """
+
+    def __init__(self, capacity=DEFAULT_CACHE_SIZE):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        # digest of the last candidate array of each action, reused while the same array is passed
+        self.last_candidates = {}
+        self.stale = False
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, action, state, extra_input, right_input=None):
+        array, digest = self.last_candidates.get(action, (None, None))
+        if extra_input is not array:
+            digest = state_digest(extra_input)
+            self.last_candidates[action] = (extra_input, digest)
+        return action, state_digest(state), digest, None if right_input is None else state_digest(right_input)
+
+    def get(self, key):
+        with self.lock:
+            if self.stale:
+                self.stale = False
+                self.entries.clear()
+            probs = self.entries.get(key)
+            if probs is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+        return probs
+
+    def put(self, key, probs):
+        probs = probs.copy()
+        probs.setflags(write=False)
+        with self.lock:
+            self.entries[key] = probs
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        return probs
+
+    def invalidate(self):
+        """Marks every entry as outdated; safe to call from another thread."""
+        self.stale = True
+
+    def clear(self):
+        """Drops every entry, e.g. after training; the hit and miss counts are kept."""
+        with self.lock:
+            self.entries.clear()
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.
+
+    def __len__(self):
+        return len(self.entries)
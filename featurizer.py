@@ -0,0 +1,72 @@
+import numpy as np
+
+from game_state import PLAYER_LIMIT_VECTOR
+
+# each building is one-hot encoded over 0..player_limit, followed by the number of coins
+SERIALIZE_OFFSETS = np.concatenate(([0], np.cumsum(PLAYER_LIMIT_VECTOR.astype(np.intp) + 1)[:-1]))
+SERIALIZE_SIZE = int(np.sum(PLAYER_LIMIT_VECTOR.astype(np.intp) + 1)) + 1
+
+
+def one_hot_slots(counts):
+    """Returns the feature slots set for a row of building counts."""
+    return SERIALIZE_OFFSETS + np.minimum(counts, PLAYER_LIMIT_VECTOR)
+
+
+class Featurizer(object):
+    """
+    Persistent feature buffer of a game's state.
+
+    Keeps the one-hot building encoding of every seat in place and only rewrites the
+    slots of a building when its count changes; coins are copied from the state when a
+    vector is read. `serialize` returns a view that is overwritten by the next call.
+
+    By default the opponents follow the player in seat order. With `canonical=True` they are
+    sorted by their encoding instead, so positions that only differ by where the opponents
+    sit serialize identically; decisions naming an opponent then index `opponent_offsets`.
+    """
+
+    def __init__(self, state, canonical=False):
+        self.state = state
+        self.canonical = canonical
+        n_players = state.n_players
+        self.features = np.zeros((n_players, SERIALIZE_SIZE), dtype=np.float32)
+        self.output = np.zeros((n_players, n_players, SERIALIZE_SIZE), dtype=np.float32)
+        # seat order as seen by each player: themselves first, then the next players
+        self.seat_order = (np.arange(n_players)[:, None] + np.arange(n_players)[None, :]) % n_players
+        self.rebuild()
+
+    def rebuild(self):
+        """Re-encodes every seat from the state, e.g. after the state was reset or restored."""
+        self.features[:] = 0
+        rows = np.arange(self.state.n_players)[:, None]
+        self.features[rows, one_hot_slots(self.state.buildings)] = 1
+
+    def update_building(self, player_id, building):
+        """Re-encodes one building count of one seat."""
+        start = SERIALIZE_OFFSETS[building]
+        self.features[player_id, start:start + PLAYER_LIMIT_VECTOR[building] + 1] = 0
+        self.features[player_id, start + min(self.state.buildings[player_id, building],
+                                             PLAYER_LIMIT_VECTOR[building])] = 1
+
+    def opponent_offsets(self, player_id):
+        """
+        Returns the seat offsets from `player_id` of the opponents in the order they are serialized;
+        opponents with the same encoding keep their seat order.
+        """
+        offsets = range(1, self.state.n_players)
+        if not self.canonical:
+            return list(offsets)
+        self.features[:, -1] = self.state.coins
+        seats = self.seat_order[player_id]
+        # any fixed total order of the encodings will do; comparing bytes is the cheapest
+        return sorted(offsets, key=lambda offset: self.features[seats[offset]].tobytes())
+
+    def serialize(self, player_id):
+        """Returns the complete game state from the point of view of `player_id`."""
+        self.features[:, -1] = self.state.coins
+        output = self.output[player_id]
+        order = self.seat_order[player_id]
+        if self.canonical:
+            order = order[[0] + self.opponent_offsets(player_id)]
+        np.take(self.features, order, axis=0, out=output)
+        return output.reshape(-1)
@@ -1,84 +1,67 @@
-import csv
 import math
-import os
-import random
-from typing import Union
 
+import numpy as np
 from frozendict import frozendict
 
 from Building import Building
-from BuildingType import BuildingType
-from constants import activation_dict, player_limit
-from constants import starting_buildings, landmarks_tuple, major_establishments_tuple, restaurants_tuple, \
-    secondary_industry_dict, primary_industry_dict, building_cost
+from activation import RED_VALUES, GREEN_VALUES, BLUE_VALUES, RED_SPECIAL, GREEN_SPECIAL, BLUE_SPECIAL, \
+    PURPLE_SPECIAL, WHEAT_INDICES, COW_INDICES, GEAR_INDICES, RESTAURANT_INDICES, PUBLISHER_INDICES, SHOPPING_MALL, \
+    HARBOR, SUSHI_BAR, FLOWER_GARDEN, RADIO_TOWER, AIRPORT, AMUSEMENT_PARK, BUSINESS_CENTER
+from agents import make_agent
+from background_writer import open_background_writer
+from constants import activation_dict
+from constants import starting_buildings
+from eval_cache import DEFAULT_CACHE_SIZE
+from featurizer import Featurizer
+from game_events import EventLog, TurnEvent, RollEvent, ActivationEvent, PurchaseEvent, TransferEvent, TurnEndEvent, \
+    GameOverEvent
+from game_record import open_writer
+from game_rng import GameRNG, STATE_SIZE as RNG_STATE_SIZE
+from game_state import GameState, BUILDING_ORDER, BUILDING_COST_VECTOR, PLAYER_LIMIT_VECTOR, LANDMARK_INDICES, \
+    N_BUILDINGS, building_index, initial_market
 from player import Player
+from replay_buffer import DEFAULT_CAPACITY
 
 
 class Game(object):
 
-    @staticmethod
     def _init_player(
+            self,
             player_id: int = 0,
             starting_builds: frozendict = starting_buildings,
             starting_major_establishments: tuple = (),
+            name: str = '',
     ) -> Player:
-        player = Player()
-        player.id = player_id
-        player.buildings = {}
-        for major_establishment in major_establishments_tuple:
-            player.buildings[major_establishment] = 1 if major_establishment in starting_major_establishments else 0
-        for landmark in landmarks_tuple:
-            player.buildings[landmark] = 0
-        for establishment in starting_builds:
-            player.buildings[establishment] = starting_builds[establishment]
-        player.coins = 0
+        agent = make_agent(self.agents[player_id], self.agent_options.get(self.agents[player_id]))
+        player = Player(self, player_id, name, self.replay_capacity, agent)
+        self.state.reset_player(player_id, starting_builds)
+        for major_establishment in starting_major_establishments:
+            self.state.buildings[player_id, building_index(major_establishment)] = 1
         player.is_first_turn = True
         return player
 
     @staticmethod
-    def _init_market(n_players: int = 2) -> dict:
+    def _init_market(n_players: int = 2) -> np.ndarray:
         """Initialize the market with establishment cards."""
-        market_dict = {landmark: n_players for landmark in landmarks_tuple}
-        market_dict = {
-            **market_dict,
-            **{
-                major_establishment: n_players
-                for major_establishment in major_establishments_tuple
-            },
-        }
-        for building in (
-                list(primary_industry_dict.keys())
-                + list(secondary_industry_dict.keys())
-                + list(restaurants_tuple)
-        ):
-            market_dict[building] = 6
+        return initial_market(n_players)
 
-        return market_dict
-
-    def __init__(self, n_players: int, pre_existing_players=None, name='', options=None):
+    def __init__(self, n_players: int, pre_existing_players=None, name='', options=None, game_id=0):
+        if options is None:
+            options = {}
         self.n_players = n_players
-        self.players = {
-            i: self._init_player(
-                player_id=i,
-                starting_builds=starting_buildings,
-                starting_major_establishments=(),
-            )
-            for i in range(n_players)
-        }
-        self.market = self._init_market(n_players=n_players)
+        self.id = game_id
+        # streams for dice, decisions, the Business Center and seating, see game_rng.py
+        self.rng = GameRNG(options.get('seed'), game_id)
+        self.state = GameState(n_players)
+        self.state.market[:] = self._init_market(n_players=n_players)
+        self.market = self.state.market
         self.current_player_id = 0
         self.current_turn = 0
 
-        if 'full_record' in options and options['full_record'] != '':
-            self.full_record = True
-            if not os.path.exists(options['full_record']):
-                with open(options['full_record'], 'w') as f:
-                    writer = csv.writer(f)
-                    writer.writerow(self.get_full_record_headers())
-            self.full_record_file = open(options['full_record'], 'a')
-            self.full_record_writer = csv.writer(self.full_record_file)
-        else:
-            self.full_record = False
+        # directory of compressed column chunks, see game_record.py
+        self.full_record = options.get('full_record', '') != ''
+        if self.full_record:
+            self.full_record_writer = open_writer(options['full_record'])
         if 'use_max_probability' not in options:
             self.use_max_probability = False
         else:
@@ -87,14 +70,36 @@ class Game(object):
             self.prob_mod = 0.
         else:
             self.prob_mod = options['prob_mod']
+        self.replay_capacity = options.get('replay_capacity', DEFAULT_CAPACITY)
+        # entries of each PlayerAI's evaluation cache; 0 disables it
+        self.eval_cache_size = options.get('eval_cache_size', DEFAULT_CACHE_SIZE)
+        # agent name of every player id, see agents.AGENTS
+        self.agents = options.get('agents') or ['neural'] * n_players
+        # keyword arguments of each kind of agent, e.g. {'planner': {'time_budget': 0.5}}
+        self.agent_options = options.get('agent_options', {})
+        # 'separate' builds one model per action, 'shared_trunk' one SharedTrunkNetwork per player
+        self.architecture = options.get('architecture', 'separate')
+        # serialize opponents in a seat-independent order, see Featurizer
+        self.canonical_opponents = options.get('canonical_opponents', False)
         if not pre_existing_players:
-            self.players = [Player(self, i, name) for i in range(5)]
-            self.initialize_player_ai()
+            self.players = [
+                self._init_player(
+                    player_id=i,
+                    starting_builds=starting_buildings,
+                    starting_major_establishments=(),
+                    name=name,
+                )
+                for i in range(n_players)
+            ]
+            self.featurizer = Featurizer(self.state, self.canonical_opponents)
+            if options.get('initialize_ai', True):
+                self.initialize_player_ai()
         else:
-            random.shuffle(pre_existing_players)
+            self.rng.seating.shuffle(pre_existing_players)
             self.players = [player.reset_game(self, i) for i, player in enumerate(pre_existing_players)]
+            self.featurizer = Featurizer(self.state, self.canonical_opponents)
 
-        self.id = id
+        self.events = EventLog.from_options(options.get('event_sink', 'none'), options.get('event_level', 'info'))
         self.name = name
         # may be used for weighting
         self.turn = 0
@@ -102,7 +107,9 @@ class Game(object):
             self.record_game = False
         elif options['game_record_filename'] != '':
             self.record_game = True
-            self.game_record_file = open(options['game_record_filename'], 'a')
+            # lines of this game, handed to the shared writer in one piece when the game ends
+            self.game_record_lines = []
+            self.game_record_writer = open_background_writer(options['game_record_filename'])
         else:
             self.record_game = False
         self.completed = False
@@ -111,64 +118,44 @@ class Game(object):
         if not silent:
             print('Beginning game #%s' % self.id)
         if self.record_game:
-            self.game_record_file.write('---BEGIN GAME %s---\n' % self.id)
-        current_player = self.players[0]
-        while True:
-            self.turn += 1
+            self.game_record_lines.append('---BEGIN GAME %s---\n' % self.id)
+        is_game_over, winning_player_id = self.is_game_over()
+        while not is_game_over:
             if self.record_game:
-                self.game_record_file.write("BEGIN TURN %d\n" % self.turn)
+                self.game_record_lines.append("BEGIN TURN %d\n" % (self.current_turn + 1))
             if self.full_record:
                 self.record_full_game_state()
-            current_player.take_turn()
-            if current_player.win:
-                break
-            elif current_player.extra_turn:
-                current_player.extra_turn = False
-            else:
-                current_player = self.get_next_player(current_player)
-            if self.turn % 200 == 0 and not silent:
-                print('turn %s' % self.turn)
+            self.take_turn()
+            is_game_over, winning_player_id = self.is_game_over()
+            if self.current_turn % 200 == 0 and not silent:
+                print('turn %s' % self.current_turn)
                 for player in self.players:
                     print(player.coins)
+        current_player = self.players[winning_player_id]
+        current_player.win = 1
+        self.turn = self.current_turn
         if not silent:
             print('Player %d, order %d won in %d turns' % (current_player.id, current_player.order, self.turn))
         self.completed = True
         if self.record_game:
-            self.game_record_file.write(
+            self.game_record_lines.append(
                 'Player %d, order %d won in %d turns\n' % (current_player.id, current_player.order, self.turn))
-            self.game_record_file.write('FINAL STANDINGS:\n')
+            self.game_record_lines.append('FINAL STANDINGS:\n')
             for player in self.players:
-                self.game_record_file.write('+++++++++++++++++++++')
-                self.game_record_file.write("PLAYER %d\n" % player.order)
-                self.game_record_file.write("TOTAL COINS: %d\n" % player.coins)
+                self.game_record_lines.append('+++++++++++++++++++++')
+                self.game_record_lines.append("PLAYER %d\n" % player.order)
+                self.game_record_lines.append("TOTAL COINS: %d\n" % player.coins)
                 for building in Building:
-                    self.game_record_file.write("%s COUNT: %d\n" % (building, player.buildings[building]))
-            self.game_record_file.write('--------------------------------\n')
-            self.game_record_file.close()
+                    self.game_record_lines.append("%s COUNT: %d\n" % (building, player.buildings[building]))
+            self.game_record_lines.append('--------------------------------\n')
+            self.game_record_writer.write(''.join(self.game_record_lines))
         if self.full_record:
-            self.record_full_game_state()
-            self.full_record_file.close()
+            self.record_full_game_state(wins=[player.win for player in self.players])
+        self.events.close()
         for player in self.players:
             player.update_win_history()
         if player.shared_ai:
-            shared = player.AI.shared
-            for player in self.players:
-                shared.dice_history += player.dice_history
-                shared.dice_history_win += player.dice_history_win
-                shared.dice_history_turn += player.dice_history_turn
-                shared.reroll_history += player.reroll_history
-                shared.reroll_history_win += player.reroll_history_win
-                shared.reroll_history_turn += player.reroll_history_turn
-                shared.steal_history += player.steal_history
-                shared.steal_history_win += player.steal_history_win
-                shared.steal_history_turn += player.steal_history_turn
-                shared.swap_history += player.swap_history
-                shared.swap_history_win += player.swap_history_win
-                shared.swap_history_turn += player.swap_history_turn
-                shared.buy_history += player.buy_history
-                shared.buy_history_win += player.buy_history_win
-                shared.buy_history_turn += player.buy_history_turn
-                player.flush_history(flush_shared=False)
+            player.AI.shared.absorb(self.players)
 
         return self.players
 
@@ -176,12 +163,58 @@ class Game(object):
         for player in self.players:
             player.flush_history()
 
+    def snapshot(self, out=None):
+        """
+        Captures the mutable state of the game in a flat int64 buffer: market, holdings, coins,
+        current player, turn, first-turn flags and RNG streams. Players, their AI and the
+        replay buffers are not part of it.
+
+        Args:
+            out: Buffer from an earlier snapshot of this game to overwrite.
+
+        Returns:
+            The buffer, to pass to `restore`.
+        """
+        n_players = self.n_players
+        if out is None:
+            out = np.empty(self.snapshot_size(), dtype=np.int64)
+        state = self.state
+        end = N_BUILDINGS * (n_players + 1)
+        out[:N_BUILDINGS] = state.market
+        out[N_BUILDINGS:end] = state.buildings.ravel()
+        out[end:end + n_players] = state.coins
+        end += n_players
+        out[end] = self.current_player_id
+        out[end + 1] = self.current_turn
+        out[end + 2:end + 2 + n_players] = [player.is_first_turn for player in self.players]
+        self.rng.get_state(out[end + 2 + n_players:].view(np.uint64))
+        return out
+
+    def restore(self, snapshot):
+        """Resets the game to a buffer written by `snapshot` and re-encodes the features."""
+        n_players = self.n_players
+        state = self.state
+        end = N_BUILDINGS * (n_players + 1)
+        state.market[:] = snapshot[:N_BUILDINGS]
+        state.buildings[:] = snapshot[N_BUILDINGS:end].reshape(n_players, N_BUILDINGS)
+        state.coins[:] = snapshot[end:end + n_players]
+        end += n_players
+        self.current_player_id = int(snapshot[end])
+        self.current_turn = int(snapshot[end + 1])
+        for player, is_first_turn in zip(self.players, snapshot[end + 2:end + 2 + n_players]):
+            player.is_first_turn = bool(is_first_turn)
+        self.rng.set_state(snapshot[end + 2 + n_players:].view(np.uint64))
+        self.featurizer.rebuild()
+
+    def snapshot_size(self):
+        return N_BUILDINGS * (self.n_players + 1) + 2 * self.n_players + 2 + RNG_STATE_SIZE
+
     def initialize_player_ai(self):
         for player in self.players:
             player.initialize_ai()
 
     def get_next_player(self, player, offset=1):
-        return self.players[(player.order + offset) % 4]
+        return self.players[(player.order + offset) % self.n_players]
 
     def get_reverse_player_order(self, player_id: int) -> list:
         order = [player_id - 1 if player_id - 1 >= 0 else self.n_players - 1]
@@ -193,11 +226,10 @@ class Game(object):
 
         return order[:-1]
 
-    @staticmethod
-    def roll_dice(num_dice=1) -> tuple[int, bool]:
+    def roll_dice(self, num_dice=1) -> tuple[int, bool]:
         """Simulate rolling dice."""
-        roll1 = random.randint(1, 6)
-        roll2 = random.randint(1, 6) if num_dice == 2 else 0
+        roll1 = self.rng.roll_die()
+        roll2 = self.rng.roll_die() if num_dice == 2 else 0
         is_double = True if roll1 == roll2 else False
         return roll1 + roll2, is_double
 
@@ -208,262 +240,151 @@ class Game(object):
             building_count: int,
             **kwargs,
     ) -> None:
-        current_player = self.players[current_player_id]
+        buildings = self.state.buildings
+        coins = self.state.coins
 
         match card_name:
             case Building.FRUIT_AND_VEGETABLE_MARKET:
-                total_wheat_buildings = 0
-                for b_name, b_count in current_player.buildings.items():
-                    if primary_industry_dict.get(b_name, "") == BuildingType.WHEAT:
-                        total_wheat_buildings += b_count
+                total_wheat_buildings = int(buildings[current_player_id, WHEAT_INDICES].sum())
                 coins_to_gain = 2 * total_wheat_buildings
                 coins_to_gain *= building_count
-                current_player.coins += coins_to_gain
+                coins[current_player_id] += coins_to_gain
 
             case Building.CHEESE_FACTORY:
-                total_cow_buildings = 0
-                for b_name, b_count in current_player.buildings.items():
-                    if primary_industry_dict.get(b_name, "") == BuildingType.COW:
-                        total_cow_buildings += b_count
+                total_cow_buildings = int(buildings[current_player_id, COW_INDICES].sum())
                 coins_to_gain = 3 * total_cow_buildings
                 coins_to_gain *= building_count
-                current_player.coins += coins_to_gain
+                coins[current_player_id] += coins_to_gain
 
             case Building.FURNITURE_FACTORY:
-                total_gear_buildings = 0
-                for b_name, b_count in current_player.buildings.items():
-                    if primary_industry_dict.get(b_name, "") == BuildingType.GEAR:
-                        total_gear_buildings += b_count
+                total_gear_buildings = int(buildings[current_player_id, GEAR_INDICES].sum())
                 coins_to_gain = 3 * total_gear_buildings
                 coins_to_gain *= building_count
-                self.players[current_player_id].coins += coins_to_gain
+                coins[current_player_id] += coins_to_gain
 
             case Building.STADIUM:
                 reverse_player_order = self.get_reverse_player_order(current_player_id)
                 for player_id in reverse_player_order:
                     coins_to_take = 2
                     coins_to_take *= building_count
-                    coins_to_take = min(coins_to_take, self.players[player_id].coins)
-                    self.players[player_id].coins -= coins_to_take
-                    self.players[current_player_id].coins += coins_to_take
+                    coins_to_take = min(coins_to_take, coins[player_id])
+                    coins[player_id] -= coins_to_take
+                    coins[current_player_id] += coins_to_take
             case Building.TV_STATION:
                 target_player_id = kwargs["target_player_id"]
                 coins_to_take = 5
                 coins_to_take *= building_count
-                coins_to_take = min(coins_to_take, self.players[target_player_id].coins)
-                self.players[target_player_id].coins -= coins_to_take
-                self.players[current_player_id].coins += coins_to_take
+                coins_to_take = min(coins_to_take, coins[target_player_id])
+                coins[target_player_id] -= coins_to_take
+                coins[current_player_id] += coins_to_take
             case Building.BUSINESS_CENTER:
                 target_player_id = kwargs["target_player_id"]
-                target_player_building = kwargs["target_player_building"]
-                current_player_building = kwargs["current_player_building"]
-
-                self.players[target_player_id].building[
-                    target_player_building
-                ] -= 1
-
-                b_count = self.players[target_player_id].building[
-                    target_player_building
-                ]
-                if b_count == 0:
-                    self.players[target_player_id].building.pop(
-                        target_player_building
-                    )
-
-                if (target_player_building
-                        in self.players[current_player_id].buildings):
-
-                    self.players[current_player_id].buildings[
-                        target_player_building
-                    ] += 1
-                else:
-                    self.players[current_player_id].buildings[
-                        target_player_building
-                    ] = 1
-
-                b_count = self.players[current_player_id].buildings[
-                    current_player_building
-                ]
-
-                if b_count > 0:
-                    self.players[current_player_id].buildings[
-                        current_player_building
-                    ] -= 1
-
-                b_count = self.players[current_player_id].buildings[
-                    current_player_building
-                ]
-                if b_count == 0:
-                    self.players[current_player_id].buildings.pop(
-                        current_player_building)
-
-                if current_player_building in self.players[target_player_id].buildings:
-                    self.players[target_player_id].buildings[
-                        current_player_building
-                    ] += 1
-                else:
-                    self.players[target_player_id].building[
-                        current_player_building
-                    ] = 1
+                target_player_building = building_index(kwargs["target_player_building"])
+                current_player_building = building_index(kwargs["current_player_building"])
+
+                buildings[target_player_id, target_player_building] -= 1
+                buildings[current_player_id, target_player_building] += 1
+                if buildings[current_player_id, current_player_building] > 0:
+                    buildings[current_player_id, current_player_building] -= 1
+                buildings[target_player_id, current_player_building] += 1
+                for player_id in (target_player_id, current_player_id):
+                    self.featurizer.update_building(player_id, target_player_building)
+                    self.featurizer.update_building(player_id, current_player_building)
             case Building.TUNA_BOAT:
                 tuna_roll, _ = self.roll_dice(num_dice=2)
                 coins_to_gain = tuna_roll * building_count
-                self.players[current_player_id].coins += coins_to_gain
+                coins[current_player_id] += coins_to_gain
             case Building.FLOWER_SHOP:
-                current_player.coins += building_count * current_player.buildings.get(
-                    Building.FLOWER_GARDEN,
-                    0,
-                )
+                coins[current_player_id] += building_count * buildings[current_player_id, FLOWER_GARDEN]
             case Building.FOOD_WAREHOUSE:
-
-                total_restaurants = 0
-                for b_name, b_count in current_player.building.items():
-                    if b_name in restaurants_tuple:
-                        total_restaurants += b_count
-
-                current_player.coins += total_restaurants * building_count * 2
+                total_restaurants = int(buildings[current_player_id, RESTAURANT_INDICES].sum())
+                coins[current_player_id] += total_restaurants * building_count * 2
             case Building.SUSHI_BAR:
                 target_player_id = kwargs["target_player_id"]
                 receiving_player_id = kwargs["receiving_player_id"]
                 coins_to_take = 3
-                if self.players[receiving_player_id].buildings[Building.SHOPPING_MALL]:
+                if buildings[receiving_player_id, SHOPPING_MALL]:
                     coins_to_take += 1
-                if not self.players[receiving_player_id].buildings[Building.HARBOR]:
+                if not buildings[receiving_player_id, HARBOR]:
                     coins_to_take = 0
-                coins_to_take *= (
-                    self.players[receiving_player_id]
-                    .buildings[Building.SUSHI_BAR]
-                )
-                coins_to_take = min(coins_to_take, self.players[target_player_id].coins)
-                self.players[target_player_id].coins -= coins_to_take
-                self.players[receiving_player_id].coins += coins_to_take
+                coins_to_take *= buildings[receiving_player_id, SUSHI_BAR]
+                coins_to_take = min(coins_to_take, coins[target_player_id])
+                coins[target_player_id] -= coins_to_take
+                coins[receiving_player_id] += coins_to_take
             case Building.PUBLISHER:
                 reverse_player_order = self.get_reverse_player_order(current_player_id)
                 for target_player_id in reverse_player_order:
-                    coins_to_take = 0
-                    for b_name, b_count in self.players[
-                        target_player_id
-                    ].building.items():
-                        if (
-                                b_name in restaurants_tuple
-                                or secondary_industry_dict.get(b_name, "") == BuildingType.BREAD
-                        ):
-                            coins_to_take += b_count
+                    coins_to_take = int(buildings[target_player_id, PUBLISHER_INDICES].sum())
                     coins_to_take *= building_count
-                    coins_to_take = min(
-                        coins_to_take, self.players[target_player_id].coins
-                    )
-                    self.players[target_player_id].coins -= coins_to_take
-                    self.players[current_player_id].coins += coins_to_take
+                    coins_to_take = min(coins_to_take, coins[target_player_id])
+                    coins[target_player_id] -= coins_to_take
+                    coins[current_player_id] += coins_to_take
             case Building.TAX_OFFICE:
                 reverse_player_order = self.get_reverse_player_order(current_player_id)
                 for target_player_id in reverse_player_order:
-                    if self.players[target_player_id].coins >= 10:
-                        coins_to_take = math.floor(
-                            self.players[target_player_id].coins / 2
-                        )
+                    if coins[target_player_id] >= 10:
+                        coins_to_take = math.floor(coins[target_player_id] / 2)
                         coins_to_take *= building_count
-                        self.players[target_player_id].coins -= coins_to_take
-                        self.players[current_player_id].coins += coins_to_take
+                        coins[target_player_id] -= coins_to_take
+                        coins[current_player_id] += coins_to_take
             case _:
                 pass
 
     def activate_cards(self, current_player_id: int, roll: int) -> None:
         """Activate cards based on dice roll."""
-        # red goes first
+        buildings = self.state.buildings
+        coins = self.state.coins
         current_player = self.players[current_player_id]
+        # red goes first
         reverse_player_order = self.get_reverse_player_order(current_player_id)
         for player_id in reverse_player_order:
-            has_shopping_mall = self.players[player_id].buildings[Building.SHOPPING_MALL]
-            for building_name, building_count in self.players[
-                player_id
-            ].buildings.items():
-                if self.players[current_player_id].coins == 0:
-                    continue
-                if building_name not in restaurants_tuple:
-                    continue
+            if coins[current_player_id] == 0:
+                break
+            for building_name in RED_SPECIAL[roll]:
+                building_count = buildings[player_id, building_index(building_name)]
                 if building_count == 0:
                     continue
-                if roll not in activation_dict[building_name]["roll"]:
-                    continue
-                coins_to_take = activation_dict[building_name]["value"]
-                if coins_to_take == "special":
-                    kwargs = {
-                        "target_player_id": current_player_id,
-                        "receiving_player_id": player_id,
-                    }
-                    self.activate_special_card(
-                        building_name, -1, building_count, **kwargs
-                    )
-                    continue
-
-                if has_shopping_mall:
-                    coins_to_take += 1
-                coins_to_take *= building_count
-                coins_to_take = min(
-                    coins_to_take, self.players[current_player_id].coins
-                )
-                self.players[current_player_id].coins -= coins_to_take
-                print(
-                    f"{current_player_id=} lost {coins_to_take=}, "
-                    f"current player coins: {self.players[current_player_id].coins}"
-                )
-                self.players[player_id].coins += coins_to_take
-                print(
-                    f"{player_id=} gain {coins_to_take=}, current player coins: {self.players[player_id].coins}"
+                kwargs = {
+                    "target_player_id": current_player_id,
+                    "receiving_player_id": player_id,
+                }
+                self.activate_special_card(
+                    building_name, -1, building_count, **kwargs
                 )
 
-        has_shopping_mall = self.players[current_player_id].buildings[Building.SHOPPING_MALL]
-        for building_name, building_count in self.players[
-            current_player_id
-        ].buildings.items():
-            if building_name not in secondary_industry_dict:
-                continue
-            if roll not in activation_dict[building_name]["roll"]:
+            has_shopping_mall = int(buildings[player_id, SHOPPING_MALL] > 0)
+            coins_to_take = int(buildings[player_id] @ RED_VALUES[has_shopping_mall, roll])
+            coins_to_take = min(coins_to_take, coins[current_player_id])
+            if coins_to_take == 0:
                 continue
+            coins[current_player_id] -= coins_to_take
+            coins[player_id] += coins_to_take
+            if self.events.debug:
+                self.events.emit(TransferEvent(current_player_id, player_id, coins_to_take, 'restaurants'))
+
+        # green only pays the current player
+        for building_name in GREEN_SPECIAL[roll]:
+            building_count = buildings[current_player_id, building_index(building_name)]
             if building_count == 0:
                 continue
-
-            coins_to_take = activation_dict[building_name]["value"]
-            if coins_to_take == "special":
-                self.activate_special_card(
-                    building_name, current_player_id, building_count
-                )
-                continue
-
-            if has_shopping_mall and secondary_industry_dict[building_name] == BuildingType.BREAD:
-                coins_to_take += 1
-
-            coins_to_take *= building_count
-            self.players[current_player_id].coins += coins_to_take
+            self.activate_special_card(
+                building_name, current_player_id, building_count
+            )
+        has_shopping_mall = int(buildings[current_player_id, SHOPPING_MALL] > 0)
+        coins[current_player_id] += buildings[current_player_id] @ GREEN_VALUES[has_shopping_mall, roll]
 
         # blue goes next
-        for player_id in self.players:
-            for building_name, building_count in self.players[
-                player_id
-            ].building.items():
-                if building_name not in primary_industry_dict:
-                    continue
+        coins += buildings @ BLUE_VALUES[roll]
+        for player_id in range(self.n_players):
+            for building_name in BLUE_SPECIAL[roll]:
+                building_count = buildings[player_id, building_index(building_name)]
                 if building_count == 0:
                     continue
-                if roll not in activation_dict[building_name]["roll"]:
-                    continue
-
-                coins_to_take = activation_dict[building_name]["value"]
-                if coins_to_take == "special":
-                    self.activate_special_card(building_name, player_id, building_count)
-                    continue
-
-                coins_to_take *= building_count
-                self.players[player_id].coins += coins_to_take
+                self.activate_special_card(building_name, player_id, building_count)
 
         # purple goes last
-        for building_name in major_establishments_tuple:
-            if current_player.buildings.get(building_name, 0) == 0:
-                continue
-            if building_name == Building.BUSINESS_CENTER:
-                continue
-            if roll not in activation_dict[building_name]["roll"]:
+        for building_name in PURPLE_SPECIAL[roll]:
+            if buildings[current_player_id, building_index(building_name)] == 0:
                 continue
 
             kwargs = {}
@@ -479,130 +400,131 @@ class Game(object):
 
         # special treatment for business center
         if (
-                Building.BUSINESS_CENTER in current_player.buildings
+                buildings[current_player_id, BUSINESS_CENTER]
                 and roll in activation_dict[Building.BUSINESS_CENTER]["roll"]
         ):
-            kwargs: dict[str, Union[int, str]] = {
-                "target_player_id": current_player.decide_target_business_center()
-            }
-            choose_from = [
-                key
-                for key in self.players[
-                    int(kwargs["target_player_id"])
-                ].buildings.keys()
-                if self.players[int(kwargs["target_player_id"])].buildings[key] > 0
-
-            ]
-            kwargs["target_player_building"] = random.choice(choose_from)
-            kwargs["current_player_building"] = random.choice(
-                list(
-                    key
-                    for key in self.players[current_player_id].buildings.keys()
-                    if self.players[current_player_id].buildings[key] > 0
-
+            swap = current_player.decide_target_business_center()
+            if swap is not None:
+                target_player_id, target_player_building, current_player_building = swap
+                self.activate_special_card(
+                    Building.BUSINESS_CENTER,
+                    current_player_id,
+                    1,
+                    target_player_id=target_player_id,
+                    target_player_building=target_player_building,
+                    current_player_building=current_player_building,
                 )
-            )
-            self.activate_special_card(
-                Building.BUSINESS_CENTER,
-                current_player_id,
-                1,
-                **kwargs,
-            )
-
-    def clean_empty_cards(self) -> None:
-        for player_id in self.players:
-            to_pop = []
-            for building_name, building_count in self.players[
-                player_id
-            ].building.items():
-                if building_count == 0:
-                    to_pop.append(building_name)
-            for building_name in to_pop:
-                self.players[player_id].buildings.pop(building_name)
 
     def take_turn(self) -> None:
         """Simulate one turn for the current player."""
         current_player_id = self.current_player_id
         current_player = self.players[current_player_id]
+        buildings = self.state.buildings
+        coins = self.state.coins
         is_double = False
+        events = self.events
         self.current_turn += 1
-        print(f"START OF TURN {self.current_turn}")
-        for player_id in self.players:
-            print(f"\t{player_id=}, coins: {self.players[player_id].coins}")
-        if not self.players[current_player_id].is_first_turn:
+        if events.info:
+            events.emit(TurnEvent(self.current_turn, current_player_id, coins.copy(), buildings.copy()))
+        if not current_player.is_first_turn:
             # Step 1: Roll Dice
             num_dice = current_player.decide_dice()
             roll, is_double = self.roll_dice(num_dice)
-            print(
-                f"Player {current_player_id} rolled {roll} {'(which is double)' if is_double else ''}."
-            )
+            if events.info:
+                events.emit(RollEvent(current_player_id, roll, num_dice, is_double, False))
+            if self.record_game:
+                self.game_record_lines.append(f'ROLL: player {current_player_id} rolls a {roll} with {num_dice} dice\n')
 
             # Step 2: player can choose to reroll if they have radio tower
-            if current_player.buildings[Building.RADIO_TOWER]:
-                do_reroll = current_player.decide_reroll()
+            if buildings[current_player_id, RADIO_TOWER]:
+                do_reroll = current_player.decide_reroll(roll, num_dice)
                 if do_reroll:
-                    print(f"Player {current_player_id} chose to reroll")
                     roll, is_double = self.roll_dice(num_dice)
-                    print(
-                        f"Player {current_player_id} rolled {roll} {'(which is double)' if is_double else ''}."
-                    )
+                    if events.info:
+                        events.emit(RollEvent(current_player_id, roll, num_dice, is_double, True))
+                    if self.record_game:
+                        self.game_record_lines.append(
+                            f'ROLL: player {current_player_id} rolls a {roll} with {num_dice} dice\n'
+                        )
 
             # Step 3: Activate Cards
-            self.activate_cards(current_player_id, roll)
-            # technical step: clean empty cards
-            self.clean_empty_cards()
-        self.players[current_player_id].is_first_turn = False
+            if events.debug:
+                coins_before = coins.copy()
+                self.activate_cards(current_player_id, roll)
+                events.emit(ActivationEvent(current_player_id, roll, coins - coins_before))
+            else:
+                self.activate_cards(current_player_id, roll)
+        current_player.is_first_turn = False
 
         # Step 4: Сity hall gives a coin if active player does not have any
-        self.players[current_player_id].coins = (
-            1
-            if self.players[current_player_id].coins == 0
-            else self.players[current_player_id].coins
-        )
+        if coins[current_player_id] == 0:
+            coins[current_player_id] = 1
+
+        if self.record_game:
+            self.game_record_lines.append(f'COINS: player {current_player_id} has {coins[current_player_id]} coins\n')
 
         # Step 5: Buy a card
-        possible_purchases = [
-            card
-            for card, count in self.market.items()
-            if building_cost[card] <= current_player.coins
-               and count > 0
-               and not current_player.buildings.get(card, 0) == player_limit[card]
-        ]
-        print(f"{possible_purchases}")
+        holdings = buildings[current_player_id]
+        can_buy = (
+                (self.state.market > 0)
+                & (BUILDING_COST_VECTOR <= coins[current_player_id])
+                & (holdings < PLAYER_LIMIT_VECTOR)
+        )
+        possible_purchases = [BUILDING_ORDER[i] for i in np.flatnonzero(can_buy)]
         has_built = False
+        # read by agents that plan ahead from the purchase, see planner.py
+        self.rolled_double = is_double
         if possible_purchases:
             purchase = current_player.decide_purchase(possible_purchases)
-            self.market[purchase] -= 1
-            current_player.coins -= building_cost[purchase]
-            current_player.buildings[purchase] = current_player.buildings.get(purchase,0) + 1
+            purchase_index = self.buy(current_player_id, purchase)
             has_built = True
-            print(f"Player {current_player_id} bought {purchase}.")
-
+            if events.info:
+                events.emit(PurchaseEvent(current_player_id, purchase, int(holdings[purchase_index]),
+                                          possible_purchases))
+            if self.record_game:
+                self.game_record_lines.append(
+                    f'BUY: player {current_player_id} bought a(n) {purchase} (now has {holdings[purchase_index]})\n'
+                )
+        else:
+            if events.info:
+                events.emit(PurchaseEvent(current_player_id, None, 0, possible_purchases))
+            if self.record_game:
+                self.game_record_lines.append(f'BUY: player {current_player_id} chooses not to buy anything\n')
+
+        self.end_turn(current_player_id, has_built, is_double)
+
+    def buy(self, player_id, purchase):
+        """Moves a building from the market to a player. Returns its index."""
+        purchase_index = building_index(purchase)
+        self.state.market[purchase_index] -= 1
+        self.state.coins[player_id] -= BUILDING_COST_VECTOR[purchase_index]
+        self.state.buildings[player_id, purchase_index] += 1
+        self.featurizer.update_building(player_id, purchase_index)
+        return purchase_index
+
+    def end_turn(self, player_id, has_built, is_double):
+        """Applies the airport and amusement park and passes the turn on."""
+        holdings = self.state.buildings[player_id]
         # Step 7: airport trigger
-        if not has_built and current_player.buildings[Building.AIRPORT]:
-            current_player.coins += 10
+        if not has_built and holdings[AIRPORT]:
+            self.state.coins[player_id] += 10
 
-        for player_id in self.players:
-            print(
-                f"\t{player_id=}, coins: {self.players[player_id].coins}, "
-                f"buildings: {self.players[player_id].buildings}"
-            )
-        if is_double and current_player.buildings[Building.AMUSEMENT_PARK]:
+        if is_double and holdings[AMUSEMENT_PARK]:
             # no reason not to take a second turn (LIE)
-            pass
+            if self.record_game:
+                self.game_record_lines.append(f'EXTRA TURN: player {player_id} gets an extra turn!\n')
         else:
             self.current_player_id = (self.current_player_id + 1) % self.n_players
 
+    def record_full_game_state(self, wins=None):
+        """Appends the coins and buildings of every player at the current turn to the full record."""
+        self.full_record_writer.record(self.id, self.current_turn, self.state, wins)
+
     def is_game_over(self):
         """Check if a player has won."""
-        for player_id in self.players:
-            win = True
-            for landmark in landmarks_tuple:
-                if not self.players[player_id].buildings[landmark]:
-                    win = False
-                    break
-            if win:
-                return True, player_id
+        has_all_landmarks = self.state.buildings[:, LANDMARK_INDICES].all(axis=1)
+        if has_all_landmarks.any():
+            return True, int(np.argmax(has_all_landmarks))
         return False, -1
 
     def play_game(self):
@@ -610,11 +532,29 @@ class Game(object):
         is_game_over, winning_player_id = self.is_game_over()
         while not is_game_over:
             self.take_turn()
-            print(f"--- End of turn {self.current_turn} ---")
+            if self.events.info:
+                self.events.emit(TurnEndEvent(self.current_turn))
             is_game_over, winning_player_id = self.is_game_over()
-        print("Game over!")
-        print(f"Player {winning_player_id} wins!")
+        if self.events.info:
+            self.events.emit(GameOverEvent(winning_player_id))
+        self.events.close()
 
     def train_players(self):
         for player in self.players:
-            player.train_ai()
\ No newline at end of file
+            player.train_ai()
+
+# options under which a game writes events or records
+OUTPUT_OPTIONS = ('event_sink', 'full_record', 'game_record_filename')
+
+
+def make_players(n_players, models, options):
+    """
+    Creates players that play games with `options` using `models`, the models of every player id.
+
+    The players come from a throwaway game that writes no events or records and builds no models.
+    """
+    template_options = {key: value for key, value in options.items() if key not in OUTPUT_OPTIONS}
+    players = Game(n_players, options={**template_options, 'initialize_ai': False}).players
+    for player in players:
+        player.AI.models = models[player.id]
+    return players
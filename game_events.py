@@ -0,0 +1,129 @@
+import sys
+from collections import namedtuple
+
+from game_state import BUILDING_ORDER
+
+DEBUG = 10
+INFO = 20
+DISABLED = 100
+
+LEVELS = {'debug': DEBUG, 'info': INFO}
+
+
+def _buildings_repr(counts):
+    return {BUILDING_ORDER[i]: int(count) for i, count in enumerate(counts) if count}
+
+
+class TurnEvent(namedtuple('TurnEvent', 'turn player_id coins buildings')):
+    """Start of a turn, with copies of every seat's coins and building counts."""
+    level = INFO
+
+    def format(self):
+        lines = [f"START OF TURN {self.turn} (player {self.player_id})"]
+        for player_id, coins in enumerate(self.coins):
+            lines.append(f"\t{player_id=}, coins: {coins}, buildings: {_buildings_repr(self.buildings[player_id])}")
+        return '\n'.join(lines)
+
+
+class RollEvent(namedtuple('RollEvent', 'player_id roll num_dice is_double reroll')):
+    level = INFO
+
+    def format(self):
+        return (f"Player {self.player_id} {'rerolled' if self.reroll else 'rolled'} {self.roll} with "
+                f"{self.num_dice} dice{' (which is double)' if self.is_double else ''}.")
+
+
+class ActivationEvent(namedtuple('ActivationEvent', 'player_id roll coin_deltas')):
+    """Coins won or lost by every seat when the cards of a roll were activated."""
+    level = DEBUG
+
+    def format(self):
+        return f"Roll {self.roll} of player {self.player_id} activated cards, coins changed by {list(self.coin_deltas)}"
+
+
+class PurchaseEvent(namedtuple('PurchaseEvent', 'player_id building count options')):
+    """`building` is None if the player bought nothing."""
+    level = INFO
+
+    def format(self):
+        if self.building is None:
+            return f"Player {self.player_id} chose not to buy anything from {list(self.options)}."
+        return f"Player {self.player_id} bought {self.building} (now has {self.count}) from {list(self.options)}."
+
+
+class TransferEvent(namedtuple('TransferEvent', 'from_id to_id amount building')):
+    level = DEBUG
+
+    def format(self):
+        return f"Player {self.from_id} paid {self.amount} coins to player {self.to_id} ({self.building})"
+
+
+class TurnEndEvent(namedtuple('TurnEndEvent', 'turn')):
+    level = INFO
+
+    def format(self):
+        return f"--- End of turn {self.turn} ---"
+
+
+class GameOverEvent(namedtuple('GameOverEvent', 'winner_id')):
+    level = INFO
+
+    def format(self):
+        return f"Game over!\nPlayer {self.winner_id} wins!"
+
+
+class StreamSink(object):
+    """Writes formatted events to an open text stream."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, event):
+        self.stream.write(event.format() + '\n')
+
+    def close(self):
+        self.stream.flush()
+
+
+class FileSink(StreamSink):
+    def __init__(self, filename):
+        super().__init__(open(filename, 'a'))
+
+    def close(self):
+        self.stream.close()
+
+
+class EventLog(object):
+    """
+    Routes game events at or above a level to a sink.
+
+    The `debug` and `info` flags are plain attributes so the game can check them before
+    building an event; with no sink both are False and nothing is formatted or allocated.
+    """
+
+    def __init__(self, sink=None, level=INFO):
+        self.sink = sink
+        self.level = level if sink is not None else DISABLED
+        self.debug = self.level <= DEBUG
+        self.info = self.level <= INFO
+
+    @classmethod
+    def from_options(cls, sink='none', level='info'):
+        """
+        Args:
+            sink: 'stdout', 'none', or the name of a file to append to.
+            level: 'debug' or 'info'.
+        """
+        if sink is None or sink == 'none':
+            return cls()
+        if sink == 'stdout':
+            return cls(StreamSink(sys.stdout), LEVELS[level])
+        return cls(FileSink(sink), LEVELS[level])
+
+    def emit(self, event):
+        if event.level >= self.level:
+            self.sink.write(event)
+
+    def close(self):
+        if self.sink is not None:
+            self.sink.close()
@@ -0,0 +1,142 @@
+import atexit
+import glob
+import os
+import threading
+import time
+
+import numpy as np
+
+from game_state import N_BUILDINGS
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+# one row per player per recorded turn
+COLUMNS = {
+    'game_id': np.int32,
+    'turn': np.int32,
+    'player': np.int8,
+    'coins': np.int32,
+    'win': np.int8,
+    'buildings': np.int8,
+}
+
+
+class GameRecordWriter(object):
+    """
+    Buffers full game states and writes them as compressed column chunks.
+
+    Rows are collected in preallocated columns and written to `directory` as one
+    `chunk-*.npz` file whenever `chunk_size` rows have been collected (and on `close`).
+    Chunk names include the process id, so several worker processes can record into the
+    same directory. Games running in several threads of a process share the writer.
+    """
+
+    def __init__(self, directory, chunk_size=DEFAULT_CHUNK_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.columns = {
+            name: np.zeros((chunk_size, N_BUILDINGS) if name == 'buildings' else chunk_size, dtype=dtype)
+            for name, dtype in COLUMNS.items()
+        }
+        self.size = 0
+        self.n_chunks = 0
+        self.lock = threading.Lock()
+
+    def record(self, game_id, turn, state, wins=None):
+        """
+        Appends one row per player of `state`.
+
+        Args:
+            wins: Win flag of every player, recorded with the final state of a game.
+        """
+        n = state.n_players
+        with self.lock:
+            if self.size + n > self.chunk_size:
+                self._flush()
+            rows = slice(self.size, self.size + n)
+            columns = self.columns
+            columns['game_id'][rows] = game_id
+            columns['turn'][rows] = turn
+            columns['player'][rows] = np.arange(n)
+            columns['coins'][rows] = state.coins
+            columns['win'][rows] = 0 if wins is None else wins
+            columns['buildings'][rows] = state.buildings
+            self.size += n
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.size == 0:
+            return
+        filename = os.path.join(
+            self.directory, f'chunk-{time.time_ns():020d}-{os.getpid()}-{self.n_chunks:05d}.npz'
+        )
+        np.savez_compressed(filename, **{name: column[:self.size] for name, column in self.columns.items()})
+        self.size = 0
+        self.n_chunks += 1
+
+    close = flush
+
+
+# one writer per directory and process, shared by every game the process plays
+_writers = {}
+
+
+def open_writer(directory):
+    if directory not in _writers:
+        _writers[directory] = GameRecordWriter(directory)
+    return _writers[directory]
+
+
+@atexit.register
+def close_writers():
+    """Writes the buffered rows of every open writer."""
+    for writer in _writers.values():
+        writer.close()
+
+
+def load_record(directory):
+    """
+    Returns the recorded columns of `directory` as read-only memory-mapped arrays.
+
+    The chunks are decompressed once into one `.npy` file per column under
+    `directory/columns`; the files are rebuilt when chunks were added since.
+    """
+    chunks = sorted(glob.glob(os.path.join(directory, 'chunk-*.npz')))
+    column_dir = os.path.join(directory, 'columns')
+    index_file = os.path.join(column_dir, 'chunks.txt')
+    index = '\n'.join(os.path.basename(chunk) for chunk in chunks)
+    consolidated = None
+    if os.path.exists(index_file):
+        with open(index_file) as f:
+            consolidated = f.read()
+    if consolidated != index:
+        _consolidate(chunks, column_dir)
+        with open(index_file, 'w') as f:
+            f.write(index)
+    return {name: np.load(os.path.join(column_dir, f'{name}.npy'), mmap_mode='r') for name in COLUMNS}
+
+
+def _consolidate(chunks, column_dir):
+    """Concatenates the chunks column by column without holding more than one chunk in memory."""
+    os.makedirs(column_dir, exist_ok=True)
+    sizes = []
+    for chunk in chunks:
+        with np.load(chunk) as data:
+            sizes.append(len(data['game_id']))
+    offsets = [0] + np.cumsum(sizes, dtype=np.int64).tolist()
+    outputs = {
+        name: np.lib.format.open_memmap(
+            os.path.join(column_dir, f'{name}.npy'), mode='w+', dtype=dtype,
+            shape=(offsets[-1], N_BUILDINGS) if name == 'buildings' else (offsets[-1],),
+        )
+        for name, dtype in COLUMNS.items()
+    }
+    for chunk, start, stop in zip(chunks, offsets[:-1], offsets[1:]):
+        with np.load(chunk) as data:
+            for name, output in outputs.items():
+                output[start:stop] = data[name]
+    for output in outputs.values():
+        output.flush()
@@ -0,0 +1,99 @@
+import numpy as np
+
+DICE_BLOCK_SIZE = 1024
+STREAMS = ('dice', 'ai', 'business_center', 'seating')
+# a PCG64 state is two 128-bit integers and the buffered 32-bit half of the last draw
+WORDS_PER_STREAM = 6
+# the stream states and the position in the block of dice faces
+STATE_SIZE = len(STREAMS) * WORDS_PER_STREAM + 1
+_MASK = (1 << 64) - 1
+
+
+def _state_words(bit_generator):
+    state = bit_generator.state
+    return (
+        state['state']['state'] >> 64, state['state']['state'] & _MASK,
+        state['state']['inc'] >> 64, state['state']['inc'] & _MASK,
+        state['has_uint32'], state['uinteger'],
+    )
+
+
+def _set_state_words(bit_generator, words):
+    bit_generator.state = {
+        'bit_generator': 'PCG64',
+        'state': {'state': (words[0] << 64) | words[1], 'inc': (words[2] << 64) | words[3]},
+        'has_uint32': words[4],
+        'uinteger': words[5],
+    }
+
+
+class GameRNG(object):
+    """
+    Independent random streams of one game.
+
+    The streams are spawned from `SeedSequence(seed, spawn_key=(game_id,))`, i.e. the
+    `game_id`-th child of the root seed, so a game draws the same numbers whichever process
+    plays it and in whatever order. With `seed=None` the root is fresh OS entropy.
+
+    Attributes:
+        ai: Sampling of the players' decisions.
+        business_center: Sampling of the Business Center swap.
+        seating: Shuffling of the seat order.
+    """
+
+    def __init__(self, seed=None, game_id=0):
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.dice, self.ai, self.business_center, self.seating = (
+            np.random.default_rng(sequence)
+            for sequence in np.random.SeedSequence(seed, spawn_key=(game_id,)).spawn(4)
+        )
+        self.faces = []
+        self.next_face = 0
+        # state of the dice stream before the current block was drawn
+        self.block_words = None
+
+    def draw_block(self):
+        self.block_words = _state_words(self.dice.bit_generator)
+        self.faces = self.dice.integers(1, 7, size=DICE_BLOCK_SIZE, dtype=np.int8).tolist()
+        self.next_face = 0
+
+    def roll_die(self):
+        """Returns the next face of the pre-drawn block, drawing a new block when it runs out."""
+        if self.next_face == len(self.faces):
+            self.draw_block()
+        face = self.faces[self.next_face]
+        self.next_face += 1
+        return face
+
+    def get_state(self, out):
+        """
+        Writes the stream states into `out`, a uint64 array of STATE_SIZE. The dice stream is
+        saved as of its current block, followed by the position in the block (0 if none).
+        """
+        for i, stream in enumerate(STREAMS):
+            if stream == 'dice' and self.block_words is not None:
+                words = self.block_words
+            else:
+                words = _state_words(getattr(self, stream).bit_generator)
+            out[i * WORDS_PER_STREAM:(i + 1) * WORDS_PER_STREAM] = words
+        out[-1] = 0 if self.block_words is None else self.next_face + 1
+
+    def set_state(self, words):
+        """Restores the stream states written by `get_state`."""
+        words = words.tolist()
+        for i, stream in enumerate(STREAMS[1:], 1):
+            stream_words = words[i * WORDS_PER_STREAM:(i + 1) * WORDS_PER_STREAM]
+            _set_state_words(getattr(self, stream).bit_generator, stream_words)
+        dice_words = tuple(words[:WORDS_PER_STREAM])
+        if words[-1] == 0:
+            _set_state_words(self.dice.bit_generator, dice_words)
+            self.faces = []
+            self.next_face = 0
+            self.block_words = None
+            return
+        if dice_words != self.block_words:
+            # the saved block was replaced since; draw it again
+            _set_state_words(self.dice.bit_generator, dice_words)
+            self.draw_block()
+        self.next_face = words[-1] - 1
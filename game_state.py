@@ -0,0 +1,81 @@
+import numpy as np
+
+from Building import Building
+from constants import building_cost, landmarks_tuple, major_establishments_tuple, player_limit, starting_buildings
+
+N_BUILDINGS = len(Building)
+# index -> Building; a building's slot in every state array is `building.value - 1`
+BUILDING_ORDER = tuple(Building)
+
+BUILDING_COST_VECTOR = np.array([building_cost[building] for building in BUILDING_ORDER], dtype=np.int32)
+PLAYER_LIMIT_VECTOR = np.array([player_limit[building] for building in BUILDING_ORDER], dtype=np.int8)
+LANDMARK_INDICES = np.array([landmark.value - 1 for landmark in landmarks_tuple], dtype=np.intp)
+
+
+def building_index(building: Building) -> int:
+    """Returns the slot of a building in the state arrays."""
+    return building.value - 1
+
+
+def buildings_to_vector(buildings: dict) -> np.ndarray:
+    """Converts a dict of building counts into a count vector."""
+    vector = np.zeros(N_BUILDINGS, dtype=np.int8)
+    for building, count in buildings.items():
+        vector[building.value - 1] = count
+    return vector
+
+
+def initial_market(n_players: int) -> np.ndarray:
+    """Returns the market counts at the start of a game."""
+    market = np.full(N_BUILDINGS, 6, dtype=np.int8)
+    for landmark in landmarks_tuple:
+        market[building_index(landmark)] = n_players
+    for major_establishment in major_establishments_tuple:
+        market[building_index(major_establishment)] = n_players
+    return market
+
+
+class BuildingCounts(object):
+    """
+    View of one player's row of `GameState.buildings`, indexed by `Building`.
+
+    Reads and writes go straight to the underlying array, so the view stays valid
+    for as long as the state array it was created from.
+    """
+    __slots__ = ('row',)
+
+    def __init__(self, row: np.ndarray):
+        self.row = row
+
+    def __getitem__(self, building: Building) -> int:
+        return int(self.row[building.value - 1])
+
+    def __setitem__(self, building: Building, count: int) -> None:
+        self.row[building.value - 1] = count
+
+    def __repr__(self):
+        return repr({BUILDING_ORDER[i]: int(self.row[i]) for i in np.flatnonzero(self.row)})
+
+
+class GameState(object):
+    """
+    Compact mutable state of a game.
+
+    Holdings are a `(n_players, N_BUILDINGS)` int array with one slot per `Building`,
+    coins are one vector for all players and the market is a single count vector.
+    """
+    __slots__ = ('buildings', 'coins', 'market')
+
+    def __init__(self, n_players: int):
+        self.buildings = np.zeros((n_players, N_BUILDINGS), dtype=np.int8)
+        self.coins = np.zeros(n_players, dtype=np.int32)
+        self.market = np.zeros(N_BUILDINGS, dtype=np.int8)
+
+    @property
+    def n_players(self) -> int:
+        return self.coins.shape[0]
+
+    def reset_player(self, player_id: int, starting_builds: dict = starting_buildings, coins: int = 0) -> None:
+        """Resets a player's holdings to the starting buildings."""
+        self.buildings[player_id] = buildings_to_vector(starting_builds)
+        self.coins[player_id] = coins
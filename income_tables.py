@@ -0,0 +1,136 @@
+import numpy as np
+
+from activation import MAX_ROLL, RED_VALUES, GREEN_VALUES, BLUE_VALUES, WHEAT_INDICES, COW_INDICES, GEAR_INDICES, \
+    RESTAURANT_INDICES, SHOPPING_MALL, HARBOR, SUSHI_BAR, FLOWER_GARDEN, FRUIT_AND_VEGETABLE_MARKET, CHEESE_FACTORY, \
+    FURNITURE_FACTORY, FLOWER_SHOP, FOOD_WAREHOUSE, TUNA_BOAT, STADIUM, TV_STATION
+from game_state import BUILDING_COST_VECTOR
+
+
+def _roll_probabilities():
+    probabilities = np.zeros((3, MAX_ROLL + 1))
+    probabilities[1, 1:7] = 1 / 6
+    for first in range(1, 7):
+        for second in range(1, 7):
+            probabilities[2, first + second] += 1 / 36
+    return probabilities
+
+
+# ROLL_PROBABILITIES[num_dice, roll]
+ROLL_PROBABILITIES = _roll_probabilities()
+
+# coins one more copy of a building pays for each roll, from its fixed payout only
+# OWN_PAYOUTS[has_mall, roll, building]: on the owner's turn (green and blue cards)
+OWN_PAYOUTS = GREEN_VALUES + BLUE_VALUES[None]
+# OPPONENT_PAYOUTS[has_harbor, has_mall, roll, building]: on another player's turn (red and blue cards)
+OPPONENT_PAYOUTS = np.stack([RED_VALUES, RED_VALUES]) + BLUE_VALUES[None, None]
+# the sushi bar only takes coins from the roller with a harbor
+OPPONENT_PAYOUTS[1, :, 1, SUSHI_BAR] = [3, 4]
+
+# mean and variance of the two-dice tuna roll paid per tuna boat
+TUNA_MEAN = 7.
+TUNA_VARIANCE = 35 / 6
+
+# green cards paying `multiplier` coins per card of their inputs: (card, rolls, multiplier, inputs)
+FACTORIES = (
+    (FRUIT_AND_VEGETABLE_MARKET, (11, 12), 2, WHEAT_INDICES),
+    (CHEESE_FACTORY, (7,), 3, COW_INDICES),
+    (FURNITURE_FACTORY, (8,), 3, GEAR_INDICES),
+    (FLOWER_SHOP, (6,), 1, np.array([FLOWER_GARDEN])),
+    (FOOD_WAREHOUSE, (12, 13), 2, RESTAURANT_INDICES),
+)
+
+
+def payout_tables(holdings, n_players):
+    """
+    Coins one more copy of each building pays for each roll, given a player's holdings.
+
+    Besides the fixed payouts this covers the factories (and the inputs they multiply),
+    the tuna boat at its mean, the stadium and TV station, and the shopping mall and
+    harbor bonuses. Payouts are before the payer runs out of coins; the publisher, tax
+    office and business center depend on the opponents and pay nothing here.
+
+    Args:
+        holdings: Building counts of the player, shape (N_BUILDINGS,).
+        n_players: Number of players in the game.
+
+    Returns:
+        The payouts on the player's own turn and on another player's turn, each of shape
+        (MAX_ROLL + 1, N_BUILDINGS).
+    """
+    has_mall = int(holdings[SHOPPING_MALL] > 0)
+    has_harbor = int(holdings[HARBOR] > 0)
+    own = OWN_PAYOUTS[has_mall].astype(np.float64)
+    opponent = OPPONENT_PAYOUTS[has_harbor, has_mall].astype(np.float64)
+
+    for card, rolls, multiplier, inputs in FACTORIES:
+        rolls = list(rolls)
+        own[rolls, card] += multiplier * holdings[inputs].sum()
+        own[np.ix_(rolls, inputs)] += multiplier * holdings[card]
+    own[12, TUNA_BOAT] += TUNA_MEAN
+    opponent[12, TUNA_BOAT] += TUNA_MEAN
+    # purple cards activate once however many copies are owned
+    if not holdings[STADIUM]:
+        own[6, STADIUM] += 2 * (n_players - 1)
+    if not holdings[TV_STATION]:
+        own[6, TV_STATION] += 5
+
+    if not has_mall:
+        own[:, SHOPPING_MALL] = (GREEN_VALUES[1] - GREEN_VALUES[0]) @ holdings
+        opponent[:, SHOPPING_MALL] = (RED_VALUES[1] - RED_VALUES[0]) @ holdings
+        opponent[1, SHOPPING_MALL] += has_harbor * holdings[SUSHI_BAR]
+    if not has_harbor:
+        opponent[1, HARBOR] = (3 + has_mall) * holdings[SUSHI_BAR]
+    return own, opponent
+
+
+def income_moments(holdings, n_players, num_dice, opponent_dice=None):
+    """
+    Exact mean and variance of the coins one more copy of each building earns per round.
+
+    A round is one turn of every player; turns are independent, so the moments of the
+    player's own turn and of the `n_players - 1` opponent turns add up.
+
+    Args:
+        num_dice: Number of dice the player rolls (1, or 2 with the train station).
+        opponent_dice: Number of dice the opponents roll; defaults to `num_dice`.
+
+    Returns:
+        The mean and variance per building, each of shape (N_BUILDINGS,).
+    """
+    if opponent_dice is None:
+        opponent_dice = num_dice
+    own, opponent = payout_tables(holdings, n_players)
+    own_probabilities = ROLL_PROBABILITIES[num_dice]
+    opponent_probabilities = ROLL_PROBABILITIES[opponent_dice]
+    own_mean = own_probabilities @ own
+    opponent_mean = opponent_probabilities @ opponent
+    mean = own_mean + (n_players - 1) * opponent_mean
+    variance = (
+            own_probabilities @ own ** 2 - own_mean ** 2
+            + (n_players - 1) * (opponent_probabilities @ opponent ** 2 - opponent_mean ** 2)
+    )
+    variance[TUNA_BOAT] += TUNA_VARIANCE * (own_probabilities[12] + (n_players - 1) * opponent_probabilities[12])
+    return mean, variance
+
+
+def purchase_scores(holdings, n_players, num_dice):
+    """Expected coins per round per coin spent for one more copy of each building, with the opponents rolling alike."""
+    own, opponent = payout_tables(holdings, n_players)
+    return ROLL_PROBABILITIES[num_dice] @ (own + (n_players - 1) * opponent) / BUILDING_COST_VECTOR
+
+
+def turn_income(holdings, n_players):
+    """
+    Coins a player's current holdings earn on their own turn for each roll, at the tuna boat's
+    mean and before the payers run out of coins.
+
+    Returns:
+        An array of shape (MAX_ROLL + 1,).
+    """
+    has_mall = int(holdings[SHOPPING_MALL] > 0)
+    income = OWN_PAYOUTS[has_mall] @ holdings.astype(np.float64)
+    for card, rolls, multiplier, inputs in FACTORIES:
+        income[list(rolls)] += multiplier * holdings[inputs].sum() * holdings[card]
+    income[12] += TUNA_MEAN * holdings[TUNA_BOAT]
+    income[6] += 2 * (n_players - 1) * (holdings[STADIUM] > 0) + 5 * (holdings[TV_STATION] > 0)
+    return income
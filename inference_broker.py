@@ -0,0 +1,122 @@
+import threading
+
+import numpy as np
+
+
+class PendingPrediction(object):
+    """A model evaluation waiting for the next batched forward pass."""
+    __slots__ = ('input_data', 'result', 'done')
+
+    def __init__(self, input_data):
+        self.input_data = input_data
+        self.result = None
+        self.done = False
+
+
+class InferenceBroker(object):
+    """
+    Batches model evaluations from many games that run concurrently.
+
+    Every game runs in its own thread and blocks in `predict`. Requests are grouped by
+    model, i.e. by action type (and by player when the AI is not shared). Once every
+    running game is waiting, or `max_wait` seconds have passed, all pending requests are
+    answered with one forward pass per model and the rows are handed back to each game.
+    """
+
+    def __init__(self, max_wait=0.01):
+        """
+        Args:
+            max_wait: Seconds a request waits for the other games before flushing anyway.
+        """
+        self.max_wait = max_wait
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.pending = {}
+        self.n_pending = 0
+        self.n_clients = 0
+        # statistics
+        self.n_batches = 0
+        self.n_requests = 0
+
+    def attach(self, players):
+        """Routes the evaluations of the players' AIs through this broker."""
+        for player in players:
+            player.AI.broker = self
+
+    def predict(self, model, input_data):
+        """
+        Evaluates `model` on `input_data` as part of the next batch.
+
+        Returns:
+            The model's predictions for the rows of `input_data`.
+        """
+        request = PendingPrediction(input_data)
+        with self.condition:
+            self.pending.setdefault(model, []).append(request)
+            self.n_pending += 1
+            if self.n_pending < self.n_clients:
+                self.condition.wait_for(lambda: request.done, timeout=self.max_wait)
+        if not request.done:
+            self.flush()
+        return request.result
+
+    def flush(self):
+        """Runs one forward pass per model over all pending requests."""
+        with self.flush_lock:
+            with self.condition:
+                pending, self.pending, self.n_pending = self.pending, {}, 0
+            for model, requests in pending.items():
+                inputs = np.concatenate([request.input_data for request in requests])
+                predictions = np.asarray(model.predict_on_batch(inputs))
+                start = 0
+                for request in requests:
+                    end = start + request.input_data.shape[0]
+                    request.result = predictions[start:end]
+                    start = end
+                self.n_batches += 1
+                self.n_requests += len(requests)
+            with self.condition:
+                for requests in pending.values():
+                    for request in requests:
+                        request.done = True
+                self.condition.notify_all()
+
+    def run(self, jobs):
+        """
+        Runs every job in its own thread as a client of the broker.
+
+        Args:
+            jobs: Callables taking no arguments, e.g. `game.run` of games whose players are attached.
+
+        Returns:
+            The return value of every job, in order.
+        """
+        results = [None] * len(jobs)
+        errors = []
+
+        def client(i, job):
+            try:
+                results[i] = job()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                self.leave()
+
+        with self.condition:
+            self.n_clients += len(jobs)
+        threads = [threading.Thread(target=client, args=(i, job)) for i, job in enumerate(jobs)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return results
+
+    def leave(self):
+        """Removes a finished client; flushes if everyone left is already waiting."""
+        with self.condition:
+            self.n_clients -= 1
+            should_flush = 0 < self.n_clients <= self.n_pending
+        if should_flush:
+            self.flush()
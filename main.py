@@ -1,53 +1,194 @@
 import argparse
+import multiprocessing
 import sys
+from functools import partial
 
 import numpy as np
 
-from game import Game
+from actor_learner import learn, DEFAULT_PUBLISH_INTERVAL
+from agents import AGENTS
+from background_writer import close_background_writers
+from game import Game, make_players
+from game_record import close_writers
+from inference_broker import InferenceBroker
+from player_ai import SharedAI, freeze_models
+
+N_PLAYERS = 4
+
+
+def play_games(task):
+    """
+    Plays a block of self-play games in a worker process.
+
+    Args:
+        task: The frozen models of every player id, the ids of the games to play and the game options.
+
+    Returns:
+        The number of turns of every game and the recorded history of every player id.
+    """
+    models, game_ids, options = task
+    players = make_players(len(models), models, options)
+    turns = []
+    for game_id in game_ids:
+        game = Game(len(players), players, options=options, game_id=game_id)
+        game.run(silent=True)
+        turns.append(game.turn)
+    # pool workers are not guaranteed to run atexit handlers
+    close_writers()
+    close_background_writers()
+    return turns, {player.id: player.export_history() for player in players}
+
+
+def play_parallel(pool, n_processes, players, game_ids, options):
+    """
+    Spreads self-play games over a process pool and merges the recorded histories into `players`.
+
+    Returns:
+        The number of turns of every game.
+    """
+    # shared models are converted (and pickled) once
+    models = freeze_models(players)
+    blocks = [list(block) for block in np.array_split(game_ids, n_processes) if len(block)]
+    results = pool.map(play_games, [(models, block, options) for block in blocks])
+
+    turns = []
+    players_by_id = {player.id: player for player in players}
+    for block_turns, histories in results:
+        turns += block_turns
+        for player_id, history in histories.items():
+            players_by_id[player_id].merge_history(history)
+    if players[0].shared_ai:
+        players[0].AI.shared.absorb(players)
+    return turns
+
+
+def make_lanes(broker, players, n_lanes, options):
+    """
+    Creates `n_lanes` sets of players for games played concurrently through `broker`.
+
+    Lane players evaluate with the models and the evaluation cache of the player with the
+    same id, but record into replay stores of their own, so concurrent games never write to
+    a shared store.
+    """
+    players_by_id = {player.id: player for player in players}
+    lanes = []
+    for _ in range(n_lanes):
+        lane = make_players(len(players), {player.id: player.AI.models for player in players}, options)
+        for player in lane:
+            player.AI.cache = players_by_id[player.id].AI.cache
+        broker.attach(lane)
+        lanes.append(lane)
+    return lanes
+
+
+def play_brokered(broker, lanes, players, game_ids, options):
+    """
+    Plays one game per lane at a time in threads, batching their evaluations through
+    `broker`, and moves the recorded decisions into `players`.
+
+    Returns:
+        The number of turns of every game.
+    """
+    turns = []
+    for start in range(0, len(game_ids), len(lanes)):
+        games = [
+            Game(len(lane), lane, options=options, game_id=game_id)
+            for lane, game_id in zip(lanes, game_ids[start:start + len(lanes)])
+        ]
+        broker.run([partial(game.run, silent=True) for game in games])
+        turns += [game.turn for game in games]
+    players_by_id = {player.id: player for player in players}
+    for lane in lanes:
+        for player in lane:
+            players_by_id[player.id].AI.replay.absorb(player.AI.replay)
+    if players[0].shared_ai:
+        players[0].AI.shared.absorb(players)
+    return turns
 
 
 def main(*args, **kwargs):
     load, name, verbose = kwargs['load'], kwargs['name'], kwargs['verbose']
     use_max_probability = kwargs['use_max_probability']
     USE_SHARED = kwargs['shared_ai']
+    n_processes = kwargs['processes']
+    background_training = kwargs['background_training']
+    actor_learner = kwargs['actor_learner']
+    # plays the saved NumPy copies of the models without training them
+    numpy_inference = kwargs['numpy_inference']
+    # workers only import TensorFlow-free modules, so they are spawned rather than forked
+    pool = multiprocessing.get_context('spawn').Pool(n_processes) if n_processes > 1 and not actor_learner else None
 
-    game = Game(0, name=name, options=kwargs)
+    game = Game(N_PLAYERS, name=name, options={**kwargs, 'initialize_ai': not numpy_inference})
     players = game.players
-    if load:
-        players[0].load_ai(False)
+    ai_players = [player for player in players if player.agent.uses_ai]
     if USE_SHARED:
-        shared_ai = SharedAI(players)
-    elif load:
-        players[1].load_ai()
-        players[2].load_ai()
-        players[3].load_ai()
+        shared_ai = SharedAI(players, kwargs['replay_capacity'])
+        if (load or numpy_inference) and ai_players:
+            shared_ai.owner.load_ai(False, numpy=numpy_inference)
+    elif load or numpy_inference:
+        for player in ai_players:
+            player.load_ai(numpy=numpy_inference)
     game.run()
-    total_turns = []
-    for k in range(25):
-        current_cycle = []
-        print('---k=%d---' % k)
-        for j in range(10):
-            sys.stdout.write('in training round j=%d' % j)
-            sys.stdout.flush()
-            for i in range(50):
-                new_game = Game(1 + i + 50 * j + 10 * 50 * k, players, options=kwargs)
-                new_game.run(silent=(not verbose))
-                current_cycle.append(new_game.turn)
-            sys.stdout.write(' ' * 30 + '\r')
-            new_game.train_players()
-        new_game.flush_player_history()
+    if kwargs['concurrent_games'] and pool is None and not actor_learner:
+        broker = InferenceBroker()
+        lanes = make_lanes(broker, players, kwargs['concurrent_games'], kwargs)
+    else:
+        broker = None
+
+    def save_models():
+        # without a neural seat or training there are no models to save
+        if not ai_players or numpy_inference:
+            return
         if USE_SHARED:
-            players[0].save_ai()
+            shared_ai.owner.save_ai()
         else:
-            for player in players:
+            for player in ai_players:
                 player.save_ai()
-        total_turns.append(current_cycle)
-        print(f'cycle #{k} had mean turns of {np.mean(current_cycle)}, sd: {np.std(current_cycle)}')
-        print('flushed history')
+
+    if actor_learner:
+        turns = learn(players, kwargs, n_processes, n_games=25 * 500, train_every=50, save_every=500,
+                      publish_interval=kwargs['publish_interval'], max_policy_lag=kwargs['max_policy_lag'],
+                      save=save_models)
+        total_turns = [turns[i:i + 500] for i in range(0, len(turns), 500)]
+    else:
+        total_turns = []
+        for k in range(25):
+            current_cycle = []
+            print('---k=%d---' % k)
+            for j in range(10):
+                sys.stdout.write('in training round j=%d' % j)
+                sys.stdout.flush()
+                game_ids = [1 + i + 50 * j + 10 * 50 * k for i in range(50)]
+                if pool is not None:
+                    current_cycle += play_parallel(pool, n_processes, players, game_ids, kwargs)
+                elif broker is not None:
+                    current_cycle += play_brokered(broker, lanes, players, game_ids, kwargs)
+                else:
+                    for game_id in game_ids:
+                        new_game = Game(N_PLAYERS, players, options=kwargs, game_id=game_id)
+                        new_game.run(silent=(not verbose))
+                        current_cycle.append(new_game.turn)
+                sys.stdout.write(' ' * 30 + '\r')
+                if not numpy_inference:
+                    for player in ai_players:
+                        player.train_ai(background=background_training)
+            for player in ai_players:
+                player.AI.wait_training()
+            for player in players:
+                player.flush_history()
+            save_models()
+            total_turns.append(current_cycle)
+            print(f'cycle #{k} had mean turns of {np.mean(current_cycle)}, sd: {np.std(current_cycle)}')
+            if pool is None and ai_players and ai_players[0].AI.cache is not None:
+                print(f'evaluation cache hit rate: {ai_players[0].AI.cache.hit_rate:.1%}')
+            print('flushed history')
+    if pool is not None:
+        pool.close()
     means = [float(sum(x)) / 500 for x in total_turns]
     with open('machikoro.log', 'a') as f:
         f.write(name + '\n+++')
-        f.write(str(players[0].AI.dice_ai.summary()))
+        if ai_players and not numpy_inference:
+            f.write(str(ai_players[0].AI.training_models()['dice'].summary()))
         f.write('+++')
         for i in range(25):
             log = f'cycle #{i} mean:{means[i]}, sd:{np.std(total_turns[i])}'
@@ -60,6 +201,9 @@ def main(*args, **kwargs):
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='teach a computer to play Machi Koro')
     parser.add_argument('--load', dest='load', action='store_true')
+    parser.add_argument('--numpy-inference', dest='numpy_inference', action='store_true',
+                        help='play the NumPy copies of the models saved under --name without TensorFlow and '
+                             'without training them; requires separate models')
     parser.add_argument('--name', dest='name', default='', help="prefix to add to loaded/saved models")
     parser.add_argument('-v', '--verbose', dest='verbose', action='store_true')
     parser.add_argument('--use-max-probability', dest='use_max_probability', action='store_true')
@@ -68,14 +212,74 @@ if __name__ == '__main__':
                         help='filename to store a verbal recollection of the game in', type=str, default='')
     parser.add_argument('--probability-mod', '--prob-mod', dest='prob_mod', type=float, default=0.,
                         help="""standard deviation of factor (mean=1) to multiply probabilities by for randomized decisionmaking; value < 0.01 recommended""")
+    parser.add_argument('--processes', dest='processes', type=int, default=1,
+                        help='number of worker processes to generate self-play games with')
+    parser.add_argument('--concurrent-games', dest='concurrent_games', type=int, default=0,
+                        help='games played at once in threads of this process, batching their model '
+                             'evaluations; 0 plays them one by one')
+    parser.add_argument('--replay-capacity', dest='replay_capacity', type=int, default=50000,
+                        help='number of decisions per action kept for training')
+    parser.add_argument('--eval-cache-size', dest='eval_cache_size', type=int, default=100000,
+                        help='decisions each AI keeps evaluated between training rounds; 0 disables the cache')
+    parser.add_argument('--actor-learner', dest='actor_learner', action='store_true',
+                        help='play continuously in --processes actor processes while this process trains')
+    parser.add_argument('--publish-interval', dest='publish_interval', type=float, default=DEFAULT_PUBLISH_INTERVAL,
+                        help='seconds between weight broadcasts to the actors')
+    parser.add_argument('--max-policy-lag', dest='max_policy_lag', type=int, default=None,
+                        help='skip training on games played with weights more than this many broadcasts old')
+    parser.add_argument('--background-training', dest='background_training', action='store_true',
+                        help='train in a background thread while the next round of games is played')
+    parser.add_argument('--shared-trunk', dest='shared_trunk', action='store_true',
+                        help='use one state encoder with a small head per action instead of separate models')
+    parser.add_argument('--canonical-opponents', dest='canonical_opponents', action='store_true',
+                        help='order opponents by their state rather than their seat, so symmetric positions share '
+                             'training samples and cached evaluations')
+    parser.add_argument('--full-record', dest='full_record', type=str, default='',
+                        help='directory to record the full state of every turn in, read with game_record.load_record')
+    parser.add_argument('--seed', dest='seed', type=int, default=None,
+                        help='root seed; every game draws from streams spawned from it by game id')
+    parser.add_argument('--agents', dest='agents', nargs=N_PLAYERS, choices=sorted(AGENTS), default=None,
+                        metavar='AGENT', help=f'agent of every player, one of {sorted(AGENTS)}; default all neural')
+    parser.add_argument('--planner-budget', dest='planner_budget', type=float, default=1.,
+                        help='seconds the planner agent may spend on each purchase')
+    parser.add_argument('--planner-rollouts', dest='planner_rollouts', type=int, default=64,
+                        help='maximum rollouts per candidate purchase of the planner agent')
+    parser.add_argument('--planner-processes', dest='planner_processes', type=int, default=0,
+                        help='processes the planner agent spreads its rollouts over; requires --processes 1')
+    parser.add_argument('--events', dest='event_sink', default=None,
+                        help="where to log game events: 'stdout', 'none' or a filename (default: stdout with -v, else none)")
+    parser.add_argument('--event-level', dest='event_level', choices=['debug', 'info'], default='info',
+                        help='debug also logs card activations and coin transfers')
     args = parser.parse_args()
 
+    if args.numpy_inference and (args.shared_trunk or args.actor_learner):
+        parser.error('--numpy-inference requires separate models and the synchronous loop')
+
     kwargs = {'load': getattr(args, 'load'),
+              'numpy_inference': getattr(args, 'numpy_inference'),
               'name': getattr(args, 'name'),
               'verbose': getattr(args, 'verbose'),
               'use_max_probability': getattr(args, 'use_max_probability'),
               'shared_ai': getattr(args, 'shared_ai'),
               'game_record_filename': getattr(args, 'game_record_filename'),
-              'prob_mod': getattr(args, 'prob_mod')}
+              'prob_mod': getattr(args, 'prob_mod'),
+              'processes': getattr(args, 'processes'),
+              'replay_capacity': getattr(args, 'replay_capacity'),
+              'concurrent_games': getattr(args, 'concurrent_games'),
+              'eval_cache_size': getattr(args, 'eval_cache_size'),
+              'background_training': getattr(args, 'background_training'),
+              'actor_learner': getattr(args, 'actor_learner'),
+              'publish_interval': getattr(args, 'publish_interval'),
+              'max_policy_lag': getattr(args, 'max_policy_lag'),
+              'architecture': 'shared_trunk' if getattr(args, 'shared_trunk') else 'separate',
+              'event_sink': getattr(args, 'event_sink') or ('stdout' if getattr(args, 'verbose') else 'none'),
+              'event_level': getattr(args, 'event_level'),
+              'canonical_opponents': getattr(args, 'canonical_opponents'),
+              'full_record': getattr(args, 'full_record'),
+              'seed': getattr(args, 'seed'),
+              'agents': getattr(args, 'agents'),
+              'agent_options': {'planner': {'time_budget': getattr(args, 'planner_budget'),
+                                            'max_rollouts': getattr(args, 'planner_rollouts'),
+                                            'processes': getattr(args, 'planner_processes')}}}
     print(kwargs)
     main(**kwargs)
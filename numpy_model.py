@@ -0,0 +1,86 @@
+import numpy as np
+
+
+def relu(x):
+    return np.maximum(x, 0, out=x)
+
+
+def softmax(x):
+    x = np.exp(x - x.max(axis=1, keepdims=True))
+    return x / x.sum(axis=1, keepdims=True)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': relu,
+    'softmax': softmax,
+}
+
+
+class NumpyModel(object):
+    """
+    Inference-only copy of a Keras decision model.
+
+    Holds the kernel and bias of every Dense layer and the activation applied after it;
+    dropout is skipped, as it is at inference time in Keras. `predict` mirrors the Keras
+    call, so the model can stand in for a Keras model in `PlayerAI.models`.
+    """
+
+    def __init__(self, kernels, biases, activations):
+        self.kernels = [np.asarray(kernel, dtype=np.float32) for kernel in kernels]
+        self.biases = [np.asarray(bias, dtype=np.float32) for bias in biases]
+        self.activations = list(activations)
+
+    @classmethod
+    def from_keras(cls, model):
+        """Pulls the Dense weights and activations out of a Sequential model."""
+        kernels, biases, activations = [], [], []
+        for layer in model.layers:
+            kind = layer.__class__.__name__
+            if kind == 'Dense':
+                kernel, bias = layer.get_weights()
+                kernels.append(kernel)
+                biases.append(bias)
+                activations.append(layer.get_config().get('activation', 'linear'))
+            elif kind == 'Activation':
+                activations[-1] = layer.get_config()['activation']
+        return cls(kernels, biases, activations)
+
+    @classmethod
+    def load(cls, filename):
+        """Loads a model written by `save`."""
+        with np.load(filename) as data:
+            n_layers = len(data['activations'])
+            return cls(
+                [data[f'kernel_{i}'] for i in range(n_layers)],
+                [data[f'bias_{i}'] for i in range(n_layers)],
+                [str(activation) for activation in data['activations']],
+            )
+
+    def save(self, filename):
+        weights = {}
+        for i, (kernel, bias) in enumerate(zip(self.kernels, self.biases)):
+            weights[f'kernel_{i}'] = kernel
+            weights[f'bias_{i}'] = bias
+        np.savez(filename, activations=np.array(self.activations), **weights)
+
+    def weights(self):
+        """Returns the weight arrays themselves, e.g. to overwrite them in place."""
+        return self.kernels + self.biases
+
+    def predict(self, input_data, **kwargs):
+        x = np.asarray(input_data, dtype=np.float32)
+        for kernel, bias, activation in zip(self.kernels, self.biases, self.activations):
+            x = ACTIVATIONS[activation](x @ kernel + bias)
+        return x
+
+    predict_on_batch = predict
+
+
+def export_models(prefix, models):
+    """
+    Writes NumPy copies of the Keras models of every action as `.npz` files that
+    `NumpyModel.load` reads without TensorFlow.
+    """
+    for action, model in models.items():
+        NumpyModel.from_keras(model).save(f"{prefix}{action}_ai.npz")
@@ -0,0 +1,167 @@
+import math
+import multiprocessing
+import threading
+import time
+
+import numpy as np
+
+from game_rng import GameRNG
+
+DEFAULT_TIME_BUDGET = 1.
+DEFAULT_MAX_ROLLOUTS = 64
+DEFAULT_MAX_CANDIDATES = 4
+ROLLOUTS_PER_ROUND = 4
+MAX_ROLLOUT_TURNS = 1000
+
+# simulation games of every thread of this process, reused by every decision
+_simulators = {}
+
+
+def _simulator(n_players, rollout_agent):
+    from game import Game
+
+    key = (n_players, rollout_agent, threading.get_ident())
+    if key not in _simulators:
+        _simulators[key] = Game(n_players, options={'agents': [rollout_agent] * n_players, 'initialize_ai': False})
+    return _simulators[key]
+
+
+def _play_out(game):
+    """Plays a game to the end. Returns the winner's seat, or -1 if it takes too long."""
+    for _ in range(MAX_ROLLOUT_TURNS):
+        is_game_over, winning_player_id = game.is_game_over()
+        if is_game_over:
+            return winning_player_id
+        game.take_turn()
+    return -1
+
+
+def run_rollouts(task):
+    """
+    Plays rollouts of every candidate purchase from a snapshot taken at a buy decision.
+
+    Rollout `i` of every candidate draws from the streams of `GameRNG(seed, i)`, so the
+    candidates are compared on the same dice. Stops early once `deadline` (a `time.time()`
+    value) has passed.
+
+    Args:
+        task: The snapshot, number of players, rollout agent name, seat of the buyer, whether
+            the buyer rolled a double, the candidate buildings, the rollout seed, the rollout
+            ids to play and the deadline.
+
+    Returns:
+        The number of wins and the number of finished rollouts of every candidate.
+    """
+    snapshot, n_players, rollout_agent, player_id, is_double, candidates, seed, rollout_ids, deadline = task
+    game = _simulator(n_players, rollout_agent)
+    wins = np.zeros(len(candidates), dtype=np.int64)
+    plays = np.zeros(len(candidates), dtype=np.int64)
+    for rollout_id in rollout_ids:
+        for i, candidate in enumerate(candidates):
+            if time.time() > deadline:
+                return wins, plays
+            game.restore(snapshot)
+            game.rng = GameRNG(seed, rollout_id)
+            game.buy(player_id, candidate)
+            game.end_turn(player_id, True, is_double)
+            wins[i] += _play_out(game) == player_id
+            plays[i] += 1
+    return wins, plays
+
+
+class RolloutPlanner(object):
+    """
+    Picks the purchase with the best empirical win rate over Monte Carlo rollouts.
+
+    Only the `max_candidates` best candidates of a heuristic ranking are simulated. Every
+    round plays `ROLLOUTS_PER_ROUND` more rollouts of each of them with cheap
+    agents in every seat, in this process or spread over a process pool. Planning stops when
+    the time budget is spent, `max_rollouts` rollouts per candidate are done or, with early
+    stopping, when the leader's Hoeffding lower bound beats every other candidate's upper
+    bound. Whatever has been played by then decides, so a decision never takes much longer
+    than the budget.
+    """
+
+    def __init__(self, time_budget=DEFAULT_TIME_BUDGET, max_rollouts=DEFAULT_MAX_ROLLOUTS,
+                 max_candidates=DEFAULT_MAX_CANDIDATES, rollout_agent='greedy', processes=0, early_stopping=True,
+                 confidence=0.05):
+        """
+        Args:
+            time_budget: Seconds per decision.
+            max_rollouts: Rollouts per candidate after which planning stops.
+            max_candidates: Number of the best ranked candidates to simulate.
+            rollout_agent: Name of the agent in `agents.AGENTS` playing every seat of a rollout.
+            processes: Size of the process pool; 0 plays the rollouts in this process. Pool
+                workers are daemonic, so planners inside self-play workers need 0.
+            early_stopping: Whether to stop once the best candidate is clear.
+            confidence: Error probability of the early-stopping bounds.
+        """
+        self.time_budget = time_budget
+        self.max_rollouts = max_rollouts
+        self.max_candidates = max_candidates
+        self.rollout_agent = rollout_agent
+        self.processes = processes
+        self.early_stopping = early_stopping
+        self.confidence = confidence
+        self.pool = None
+        # statistics of the last decision
+        self.plays = None
+        self.win_rates = None
+
+    def plan(self, game, player_id, candidates):
+        """
+        Args:
+            game: The game, stopped at `player_id`'s buy decision.
+            candidates: The buildings the player can buy, best first by some heuristic. The
+                first one is bought if no rollout finishes in time.
+
+        Returns:
+            The building to buy.
+        """
+        deadline = time.time() + self.time_budget
+        candidates = list(candidates[:self.max_candidates])
+        if len(candidates) == 1:
+            return candidates[0]
+        if self.processes and self.pool is None:
+            self.pool = multiprocessing.get_context('spawn').Pool(self.processes)
+        task = (game.snapshot(), game.n_players, self.rollout_agent, player_id, game.rolled_double, candidates,
+                int(game.rng.ai.integers(2 ** 63)))
+        wins = np.zeros(len(candidates), dtype=np.int64)
+        plays = np.zeros(len(candidates), dtype=np.int64)
+        for start in range(0, self.max_rollouts, ROLLOUTS_PER_ROUND):
+            rollout_ids = range(start, min(start + ROLLOUTS_PER_ROUND, self.max_rollouts))
+            if self.pool is None:
+                results = [run_rollouts(task + (rollout_ids, deadline))]
+            else:
+                blocks = [block for block in np.array_split(np.arange(rollout_ids.start, rollout_ids.stop),
+                                                            self.processes) if len(block)]
+                pending = self.pool.map_async(run_rollouts, [task + (list(block), deadline) for block in blocks])
+                try:
+                    results = pending.get(timeout=max(deadline - time.time(), 0.) + 0.05)
+                except multiprocessing.TimeoutError:
+                    break
+            for round_wins, round_plays in results:
+                wins += round_wins
+                plays += round_plays
+            if time.time() > deadline or (self.early_stopping and self.is_decided(wins, plays)):
+                break
+        self.plays = plays
+        self.win_rates = wins / np.maximum(plays, 1)
+        if not plays.any():
+            return candidates[0]
+        # candidates cut off by the deadline are not chosen; ties go to the better ranked
+        return candidates[int(np.argmax(np.where(plays > 0, self.win_rates, -1.)))]
+
+    def is_decided(self, wins, plays):
+        if not plays.all():
+            return False
+        rates = wins / plays
+        half_width = np.sqrt(math.log(2 * len(plays) / self.confidence) / (2 * plays))
+        best = np.argmax(rates)
+        others = np.delete(rates + half_width, best)
+        return rates[best] - half_width[best] > others.max()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
@@ -1,75 +1,104 @@
-from copy import deepcopy
-from functools import reduce
-from constants import player_limit
+import threading
+
 import numpy as np
-from numpy.random import choice as rchoice
 
 from Building import Building
-from EstablishmentCount import EstablishmentCount
-from constants import BUILDING_VECTOR_TEMPLATE
+from constants import starting_buildings, tradeable_establishments_tuple
+from featurizer import SERIALIZE_SIZE, one_hot_slots
+from game_state import BuildingCounts, building_index
 from player_ai import PlayerAI
+from replay_buffer import DEFAULT_CAPACITY
 
+# sampling settings of `choose_batch` calls without a game; games use their own options
 use_max_probability = True
 
+TRADEABLE_INDICES = np.array([building_index(building) for building in tradeable_establishments_tuple])
+
 # this makes the probabilities slightly less deterministic
 # modulate_prob = True
 prob_mod = 0.
 
+# row numbers of the decisions drawn by `choose_batch`, grown as needed
+_rows = np.arange(64)
+# `choose_batch` work arrays of `choose_from_probs`, per thread and number of candidates
+_work = threading.local()
 
-def choose_from_probs(probs, constraint_mask=None):
-    # will almost always make optimal decision;
-    if use_max_probability:
-        if constraint_mask:
-            probs = probs * constraint_mask
-        if prob_mod:
-            # np.maximum just in case modulation value is changed or some weird act of rngsus
-            probs = probs * np.maximum(0, np.random.normal(1, prob_mod, len(probs)))
-        probs = probs * (probs == np.max(probs)) + (probs ** 2 * 0.01 + 0.001) / len(probs)
-        if constraint_mask:
-            probs = probs * constraint_mask
 
+def choose_batch(probs, constraint_mask=None, rng=np.random, temperature=1., out=None, game=None):
+    """
+    Samples one choice from each row of `probs`, shaping the probabilities like `choose_from_probs`.
+
+    The rows are shaped, turned into cumulative sums and laid end to end with row `i` offset by
+    `i`, so a single `searchsorted` of `i + uniform` draws every row at once.
+
+    Args:
+        probs: Win probabilities of the candidates, shape (n_decisions, n_candidates).
+        constraint_mask: Optional array of the same shape, 0 where a candidate is illegal.
+        rng: Generator (or `np.random`) to draw the modulation noise and the samples from.
+        temperature: Exponent 1 / temperature applied to the shaped weights; below 1 is greedier.
+        out: Optional float64 work array of shape (2, n_decisions, n_candidates), reused
+            across calls.
+        game: Game whose `use_max_probability` and `prob_mod` shape the weights; defaults to
+            the module settings.
+
+    Returns:
+        The index of the chosen candidate of every row, shape (n_decisions,).
+    """
+    global _rows
+    max_probability, modulation = (
+        (use_max_probability, prob_mod) if game is None else (game.use_max_probability, game.prob_mod)
+    )
+    n_decisions, n_candidates = probs.shape
+    if out is None:
+        out = np.empty((2,) + probs.shape)
+    weights, floor = out
+    if constraint_mask is None:
+        np.copyto(weights, probs)
     else:
-        probs = probs ** 2 + 0.05 / len(
-            probs)  # will select best option most likely, but can choose other ones with decent probability
-        if constraint_mask:
-            probs = probs * constraint_mask
-
-    probs = probs / np.sum(probs)
-    choice = rchoice(range(len(probs)), size=1, p=probs)
-    return choice[0]
-
-
-class Player:
-    id: int
-    coins: int
-    buildings: dict[Building, int]
-    # major_establishments: dict[str, bool]
-    # landmarks: dict[str, bool]
-    # establishments: dict[str, EstablishmentCount]
-    is_first_turn: bool = True
-    AI: PlayerAI
-
-    def __init__(self):
-        super().__init__()
-        self.AI = PlayerAI(self)
-
-    def serialize_data(self):
-        """this vectorizes the number of buildings in each category a player has;
-        only the number of coins is represented as an integer"""
-        building_vector = deepcopy(BUILDING_VECTOR_TEMPLATE)
-        for building in Building:
-            vector = [0] * player_limit[building]
-            for i in range(self.buildings[building]):
-                vector[i] = 1
-        for i, building in enumerate(BUILDING_ORDER):
-            building_vector[i][self.buildings[building]] = 1
-        flat_vector = [x for sub in building_vector for x in sub]
-        flat_vector.append(self.coins)
-        return flat_vector
-
-    def complete_serialize(self):
-        """this returns the complete and sufficient game state based on the player whose turn it is"""
-        return reduce(list.__add__, [self.get_next_player(offset).serialize_data() for offset in range(4)])
+        np.multiply(probs, constraint_mask, out=weights)
+    if max_probability:
+        # will almost always make optimal decision;
+        if modulation:
+            # np.maximum just in case modulation value is changed or some weird act of rngsus
+            weights *= np.maximum(0, rng.normal(1, modulation, probs.shape))
+        np.square(weights, out=floor)
+        floor *= 0.01
+        floor += 0.001
+        floor /= n_candidates
+        weights *= weights == weights.max(axis=1, keepdims=True)
+    else:
+        # will select best option most likely, but can choose other ones with decent probability
+        floor.fill(0.05 / n_candidates)
+        np.square(weights, out=weights)
+    if constraint_mask is not None:
+        floor *= constraint_mask
+    weights += floor
+    if temperature != 1.:
+        weights **= 1. / temperature
+    # the last candidate of every row that can be chosen
+    last = n_candidates - 1 - np.argmax(weights[:, ::-1] > 0, axis=1)
+
+    if len(_rows) < n_decisions:
+        _rows = np.arange(max(n_decisions, 2 * len(_rows)))
+    rows = _rows[:n_decisions]
+    np.cumsum(weights, axis=1, out=weights)
+    weights /= weights[:, -1:]
+    weights += rows[:, None]
+    choices = np.searchsorted(weights.ravel(), rows + rng.random(n_decisions), side='right') - rows * n_candidates
+    # rounding of `row + uniform` can reach the start of the next row
+    return np.minimum(choices, last, out=choices)
+
+
+def choose_from_probs(probs, constraint_mask=None, rng=np.random, game=None):
+    """Samples one choice from the candidates' win probabilities; see `choose_batch`."""
+    work = getattr(_work, 'arrays', None)
+    if work is None:
+        work = _work.arrays = {}
+    out = work.get(len(probs))
+    if out is None:
+        out = work[len(probs)] = np.empty((2, 1, len(probs)))
+    mask = None if constraint_mask is None else constraint_mask[None]
+    return int(choose_batch(probs[None], mask, rng, out=out, game=game)[0])
 
 
 class Player(object):
@@ -77,7 +106,7 @@ class Player(object):
     Represents a player in the game, managing their state, actions, and AI behavior.
     """
 
-    def __init__(self, game, order, name=''):
+    def __init__(self, game, order, name='', replay_capacity=DEFAULT_CAPACITY, agent=None):
         """
         Initializes a Player instance.
 
@@ -85,72 +114,72 @@ class Player(object):
             game: The game instance the player is part of.
             order: The player's turn order in the game.
             name: Optional; the model name or identifier for the player.
+            replay_capacity: Number of decisions kept per action for training.
+            agent: Makes the player's decisions; defaults to a NeuralAgent.
         """
-        # Don't do this in production code; modifies global behavior of probability functions
-        global use_max_probability
-        global prob_mod
-        use_max_probability = game.use_max_probability
-        prob_mod = game.prob_mod
         self.game = game
-        self.buildings = deepcopy(starting_buildings)
-        self.coins = 0
         self.order = order
+        # the game resets the holdings
+        self.bind_state(game.state, order)
+        self.is_first_turn = True
         self.shared_ai = False
         self.name = name
         self.id = order  # Unique identifier for the player
         self.win = 0
-        self.extra_turn = False
-        self.double = False
-        # History tracking
-        self.dice_history = []
-        self.dice_history_turn = []
-        self.dice_history_win = []
-        self.buy_history = []
-        self.buy_history_turn = []
-        self.buy_history_win = []
-        self.steal_history = []
-        self.steal_history_turn = []
-        self.steal_history_win = []
-        self.swap_history = []
-        self.swap_history_turn = []
-        self.swap_history_win = []
-        self.reroll_history = []
-        self.reroll_history_turn = []
-        self.reroll_history_win = []
+        if agent is None:
+            # agents.py builds on this module
+            from agents import NeuralAgent
+
+            agent = NeuralAgent()
+        self.agent = agent
         # AI
-        self.AI = PlayerAI(self)
+        self.AI = PlayerAI(self, replay_capacity)
 
-    def initialize_ai(self):
+    @property
+    def coins(self) -> int:
+        return int(self.state.coins[self.order])
+
+    @coins.setter
+    def coins(self, value: int):
+        self.state.coins[self.order] = value
+
+    def bind_state(self, state, order):
         """
-        Initializes the player's AI, preparing it for decision-making.
+        Points the player at its row of a game state.
+
+        Args:
+            state: The GameState holding the player's buildings and coins.
+            order: The player's row in the state arrays.
         """
-        self.AI.initialize_ai()
+        self.state = state
+        self.buildings = BuildingCounts(state.buildings[order])
+
+    def serialize_data(self):
+        """this vectorizes the number of buildings in each category a player has;
+        only the number of coins is represented as an integer"""
+        vector = np.zeros(SERIALIZE_SIZE, dtype=np.float32)
+        vector[one_hot_slots(self.buildings.row)] = 1
+        vector[-1] = self.coins
+        return vector
+
+    def complete_serialize(self):
+        """this returns the complete and sufficient game state based on the player whose turn it is;
+        the vector is a view of the game's feature buffer and changes with the game"""
+        return self.game.featurizer.serialize(self.order)
 
-    def roll_dice(self):
+    def initialize_ai(self):
         """
-        Rolls dice for the player's turn and calculates the roll value.
-        Sets the `double` attribute if a double is rolled with two dice.
+        Initializes the player's AI, preparing it for decision-making. Players whose agent
+        does not use the AI get no models, so they never load TensorFlow.
         """
-        dice = [randint(1, 6) for _ in range(self.roll)]
-        if self.roll == 2 and dice[0] == dice[1]:
-            self.double = True
-        else:
-            self.double = False
-        self.roll_value = sum(dice)
-        if self.game.record_game:
-            self.game.game_record_file.write(
-                f'ROLL: player {self.order} rolls a {self.roll_value} {str(dice)} with {self.roll} dice\n'
-            )
+        if self.agent.uses_ai:
+            self.AI.initialize_ai()
 
     def update_win_history(self):
         """
-        Updates the win history for all recorded player actions.
+        Labels the player's decisions of the finished game with whether it won.
         """
-        self.dice_history_win += [self.win] * (len(self.dice_history) - len(self.dice_history_win))
-        self.buy_history_win += [self.win] * (len(self.buy_history) - len(self.buy_history_win))
-        self.swap_history_win += [self.win] * (len(self.swap_history) - len(self.swap_history_win))
-        self.steal_history_win += [self.win] * (len(self.steal_history) - len(self.steal_history_win))
-        self.reroll_history_win += [self.win] * (len(self.reroll_history) - len(self.reroll_history_win))
+        self.AI.replay.finish_game(self.win)
 
     def reset_game(self, game, order):
         """
@@ -165,26 +194,62 @@ class Player(object):
         """
         self.game = game
         self.AI.game = game
-        self.buildings = deepcopy(starting_buildings)
-        self.coins = 3
         self.order = order
+        self.bind_state(game.state, order)
+        self.state.reset_player(order, starting_buildings, coins=3)
+        self.is_first_turn = True
         self.win = 0
         return self
 
-    def train_ai(self, reset=False):
+    def train_ai(self, reset=False, background=False):
         """
         Trains the player's AI and optionally resets action history.
 
         Args:
             reset: Boolean indicating whether to reset the player's action history.
+            background: Whether to train in a background thread and return at once; the
+                new weights are played with as each model finishes (see `PlayerAI.start_training`).
         """
         if not self.shared_ai:
-            self.AI.train()
+            trainer = self.AI
         elif self.id == self.AI.shared.player_id:
-            self.AI.train()
+            trainer = self.AI.shared
+        else:
+            trainer = None
+        if trainer is not None and background:
+            trainer.start_training()
+        elif trainer is not None:
+            trainer.train()
         if reset:
             self.flush_history(flush_shared=False)
 
+    def load_ai(self, individual=True, numpy=False):
+        """
+        Loads the player's models.
+
+        Args:
+            individual: Whether to load this player's own models rather than the shared ones.
+            numpy: Whether to load the NumPy copies, which play without TensorFlow but can't be trained.
+        """
+        if numpy:
+            self.AI.load_numpy(self.model_prefix(individual))
+        else:
+            self.AI.load(self.model_prefix(individual))
+
+    def save_ai(self):
+        self.AI.save(self.model_prefix(not self.shared_ai))
+
+    def model_prefix(self, individual):
+        return f'{self.name}{self.id}_' if individual else self.name
+
+    def export_history(self):
+        """Returns copies of the recorded decisions, e.g. to send them from a worker process."""
+        return self.AI.replay.export()
+
+    def merge_history(self, history):
+        """Appends decisions exported by `export_history`."""
+        self.AI.replay.merge(history)
+
     def flush_history(self, flush_shared=True):
         """
         Clears the player's action history to save memory or remove irrelevant data.
@@ -192,21 +257,7 @@ class Player(object):
         Args:
             flush_shared: Whether to also flush the shared AI's history.
         """
-        self.dice_history.clear()
-        self.dice_history_turn.clear()
-        self.buy_history.clear()
-        self.buy_history_turn.clear()
-        self.steal_history.clear()
-        self.steal_history_turn.clear()
-        self.swap_history.clear()
-        self.swap_history_turn.clear()
-        self.reroll_history.clear()
-        self.reroll_history_turn.clear()
-        self.dice_history_win.clear()
-        self.buy_history_win.clear()
-        self.steal_history_win.clear()
-        self.swap_history_win.clear()
-        self.reroll_history_win.clear()
+        self.AI.replay.clear()
         if self.shared_ai and flush_shared:
             self.AI.shared.flush_history()
 
@@ -223,90 +274,75 @@ class Player(object):
         return self.game.get_next_player(self, offset)
 
     def decide_dice(self):
-        if self.buildings['station'] == 0:
-            self.roll = 1
-            return 0
-        probs = self.AI.eval_dice()
-        choice = choose_from_probs(probs)
-        if choice == 0:
-            roll = 2
-        else:
-            roll = 1
-        self.roll = roll
-        self.AI.record_dice()
-        return 0
-
-    def decide_reroll(self):
-        # note that you must reroll the same number of dice you originally rolled
-        # yes, this is from the creators
-        if self.buildings['radio_tower'] == 0:
-            self.reroll = 0
-            return 0
-        self.prev_roll_value = self.roll_value
-        probs = self.AI.eval_reroll()
-        choice = choose_from_probs(probs)
-        if choice == 0:
-            self.reroll = 1
-        else:
-            self.reroll = 0
-        if self.reroll == 1 and self.game.record_game:
-            self.game.game_record_file.write("REROLL: player %d is rerolling!\n" % self.order)
-        self.AI.record_reroll()
-        return 0
+        """
+        Returns:
+            The number of dice to roll.
+        """
+        if self.buildings[Building.TRAIN_STATION] == 0:
+            return 1
+        return self.agent.decide_dice(self)
 
-    def decide_steal(self):
+    def decide_reroll(self, roll, num_dice):
         """
-        returns the offset of the player from whombst coin should be stolen
+        Args:
+            roll: The value rolled.
+            num_dice: The number of dice rolled; a reroll uses the same number.
+
+        Returns:
+            Whether to reroll.
+        """
+        do_reroll = self.agent.decide_reroll(self, roll, num_dice)
+        if do_reroll and self.game.record_game:
+            self.game.game_record_lines.append("REROLL: player %d is rerolling!\n" % self.order)
+        return do_reroll
+
+    def decide_target_tv_station(self):
+        """
+        Returns:
+            The id of the player to take coins from.
         """
-        probs = self.AI.eval_steal()
-        choice = choose_from_probs(probs)
-        self.victim = self.get_next_player(choice + 1)
-        # index is used for self.AI.record_steal()
-        self.victim_index = choice + 1
-
-    def decide_swap(self):
-        self.create_swap_mask()
-        probs = self.AI.eval_swap()
-        self.swap_choice = choice = choose_from_probs(probs, constraint_mask=self.swap_mask)
-        self.swap_opponent_offset = 1 + (choice // 144)
-        self.swap_opponent_building = ((choice % 144) // 12)
-        self.swap_self_building = (choice % 12)
-        self.AI.record_swap()
-
-    def decide_buy(self):
-        self.create_buy_mask()
-        probs = self.AI.eval_buy()
-        self.buy_choice = choose_from_probs(probs, constraint_mask=self.buy_mask)
-        self.AI.record_buy()
-    def take_turn(self):
+        return self.agent.decide_target_tv_station(self)
+
+    def opponent_offsets(self):
+        """Returns the seat offsets of the opponents in the order the game state serializes them."""
+        return self.game.featurizer.opponent_offsets(self.order)
+
+    def create_swap_mask(self):
+        """Marks the (opponent, their building, own building) trades that are possible."""
+        buildings = self.state.buildings
+        opponents = [(self.order + offset) % self.game.n_players for offset in self.opponent_offsets()]
+        opponents_own = buildings[opponents][:, TRADEABLE_INDICES] > 0
+        own = buildings[self.order, TRADEABLE_INDICES] > 0
+        self.swap_mask = (opponents_own[:, :, None] & own).ravel().astype(float)
+        return self.swap_mask
+
+    def decode_swap(self, choice):
+        """Maps an index of the swap mask to (opponent id, their building, own building)."""
+        n_tradeable = len(tradeable_establishments_tuple)
+        opponent_index, building_pair = divmod(choice, n_tradeable ** 2)
+        opponent_building, self_building = divmod(building_pair, n_tradeable)
+        return (
+            self.get_next_player(self.opponent_offsets()[opponent_index]).order,
+            tradeable_establishments_tuple[opponent_building],
+            tradeable_establishments_tuple[self_building],
+        )
+
+    def decide_target_business_center(self):
         """
-        Executes the player's turn, including rolling dice, performing actions, and deciding purchases.
+        Returns:
+            The id of the player to trade with, the building to take from them and the building
+            to give them, or None if no trade is possible.
+        """
+        if not self.create_swap_mask().any():
+            return None
+        return self.agent.decide_target_business_center(self)
+
+    def decide_purchase(self, possible_purchases):
+        """
+        Args:
+            possible_purchases: The buildings the player can afford and that are still available.
+
+        Returns:
+            The building to buy.
         """
-        self.double = False
-        self.decide_dice()
-        self.roll_dice()
-        self.decide_reroll()
-        if self.reroll:
-            self.roll_dice()
-        self.game.activate_red(self)
-        self.coins += self.calculate_green()
-        self.game.activate_blue(self)
-        self.calculate_purple()
-        if self.game.record_game:
-            self.game.game_record_file.write(f'COINS: player {self.order} has {self.coins} coins\n')
-        self.decide_buy()
-        if self.buy_choice != 19:
-            self.buildings[BUILDING_ORDER[self.buy_choice]] += 1
-            self.game.building_supply[BUILDING_ORDER[self.buy_choice]] -= 1
-            self.coins -= building_cost[BUILDING_ORDER[self.buy_choice]]
-            if self.game.record_game:
-                self.game.game_record_file.write(
-                    f'BUY: player {self.order} bought a(n) {BUILDING_ORDER[self.buy_choice]} (now has {self.buildings[BUILDING_ORDER[self.buy_choice]]})\n'
-                )
-        elif self.game.record_game:
-            self.game.game_record_file.write(f'BUY: player {self.order} chooses not to buy anything\n')
-        if self.double and self.buildings.amusement_park == 1:
-            self.extra_turn = True
-            if self.game.record_game:
-                self.game.game_record_file.write(f'EXTRA TURN: player {self.order} gets an extra turn!\n')
-        self.check_if_win()
+        return self.agent.decide_purchase(self, possible_purchases)
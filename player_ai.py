@@ -1,13 +1,18 @@
 import numpy as np
-import tensorflow as tf
-from tensorflow.keras.layers import Input, Dense, Dropout, Activation
-from tensorflow.keras.models import Sequential, load_model
-from tensorflow.keras.optimizers import SGD
+
+from constants import tradeable_establishments_tuple
+from eval_cache import EvalCache
+from game_state import N_BUILDINGS
+from numpy_model import NumpyModel, export_models
+from replay_buffer import ReplayStore, DEFAULT_CAPACITY
+
+# TensorFlow is imported where models are built, trained or loaded, so that
+# simulation workers evaluating NumpyModels never import it
 
 input_sizes = {
     'dice': 1,
-    'buy': 19,
-    'swap': 12 * 36,
+    'buy': N_BUILDINGS,
+    'swap': 3 * len(tradeable_establishments_tuple) ** 2,
     'steal': 3,
     'reroll': 1 + 1 + 12,
     'add': 1 + 12
@@ -20,81 +25,231 @@ class PlayerAI:
     This class manages the AI for a player, including training and action recording.
     """
 
-    def __init__(self, player):
+    def __init__(self, player, replay_capacity=DEFAULT_CAPACITY):
         self.player = player
         self.game = self.player.game
         self.n_epochs = 5
-        self.construct_input()
+        self.current_input = None
+        # preallocated candidate matrices, see merge_input and merge_right
+        self.candidates = {}
+        self.right_candidates = {}
+        # one-hot rows of the legal trades, see swap_candidates
+        self.swap_rows = np.zeros((0, input_sizes['swap']), dtype=np.float32)
+        self.swap_legal = None
+        self.swap_candidates_view = None
+        self.replay = ReplayStore(actions, replay_capacity)
+        # optional InferenceBroker batching evaluations across concurrent games
+        self.broker = None
+        # LRU cache of evaluated decisions, cleared whenever the weights change
+        self.cache = EvalCache(self.game.eval_cache_size) if self.game.eval_cache_size else None
 
         self.input_dim = None
         self.models = {}
-
-        self.history = {}
-        for action in actions:
-            self.history[action] = []
-            self.history[action + '_win'] = []
-            self.history[action + '_turn'] = []
+        # SharedTrunkNetwork behind the models when the game uses the shared-trunk architecture
+        self.network = None
+        self.shared = None
+        # BackgroundTrainer once training runs in the background; self-play then uses its published copies
+        self.trainer = None
 
     def initialize_ai(self):
         """Initializes the AI by constructing the input and models."""
+        self.construct_input()
         self.input_dim = len(self.current_input)
+        if self.game.architecture == 'shared_trunk':
+            from shared_trunk import SharedTrunkNetwork
+
+            self.network = SharedTrunkNetwork(self.input_dim, input_sizes)
+            self.models = dict(self.network.heads)
+            return
         for action in actions:
             self.models[action] = self.create_model(input_sizes[action])
 
-    def train(self):
-        """Trains each of the five AI models."""
-        player = self.player
+    def train(self, replay=None):
+        """
+        Trains each of the five AI models.
+
+        Args:
+            replay: ReplayStore to train on; defaults to this AI's own.
+        """
+        import tensorflow as tf
+
+        if replay is None:
+            replay = self.replay
+        if self.cache is not None:
+            self.cache.clear()
+        self.wait_training()
+        models = self.training_models()
 
         for action in actions:
-            history = self.history[action]  # player.__dict__.get(f"{action}_history", [])
-            if history:
-                x = np.asarray(history)[:, 0, :]
-                y = tf.keras.utils.to_categorical(player.__dict__.get(f"{action}_history_win"), 2)
-                self.models[action].fit(x, y, epochs=10, batch_size=100, verbose=0)
+            x, wins, _ = replay.buffers[action].data()
+            if x is not None and len(x):
+                y = tf.keras.utils.to_categorical(wins, 2)
+                models[action].fit(x, y, epochs=10, batch_size=100, verbose=0)
+        if self.trainer is not None:
+            self.trainer.publish(actions)
+
+    def start_training(self, replay=None):
+        """
+        Starts training on a snapshot of the decisions in a background thread and returns;
+        see `background_trainer.BackgroundTrainer`.
+
+        Args:
+            replay: ReplayStore to train on; defaults to this AI's own.
+        """
+        if self.trainer is None:
+            from background_trainer import BackgroundTrainer
+
+            self.trainer = BackgroundTrainer(self)
+        self.trainer.start(self.replay if replay is None else replay, actions)
+
+    def wait_training(self):
+        """Blocks until background training, if any, has published its weights."""
+        if self.trainer is not None:
+            self.trainer.wait()
+
+    def training_models(self):
+        """Returns the Keras models that are trained and saved."""
+        return self.models if self.trainer is None else self.trainer.learners
 
     def record_action(self, action, extra_input, right_input=None):
         """Generic method to record actions and append them to the appropriate history."""
-        input_data = self.merge_input(extra_input)
+        input_data = self.merge_input(extra_input, action)
         if right_input is not None:
             input_data = self.merge_right(input_data, right_input)
 
-        self.player.history[f"{action}_history"].append(input_data)
-        self.player.history[f"{action}_turn"].append(self.player.game.turn)
+        self.replay.record(action, input_data[0], self.player.game.current_turn)
 
     def eval_action(self, action, extra_input, right_input=None):
         """Generic method to evaluate actions using the respective AI."""
-        input_data = self.merge_input(extra_input)
+        if self.cache is not None:
+            self.construct_input()
+            key = self.cache.key(action, self.current_input, extra_input, right_input)
+            probs = self.cache.get(key)
+            if probs is not None:
+                return probs
+        input_data = self.merge_input(extra_input, action)
         if right_input is not None:
             input_data = self.merge_right(input_data, right_input)
 
-        preds = self.models[action].predict(input_data)
+        if self.broker is not None:
+            preds = self.broker.predict(self.models[action], input_data)
+        else:
+            preds = self.models[action].predict(input_data)
+        if self.cache is not None:
+            return self.cache.put(key, preds[:, 1])
         return preds[:, 1]
 
-    def merge_input(self, extra_input):
-        """Merges the current input with additional input."""
+    def merge_input(self, extra_input, action=None):
+        """
+        Merges the current input with additional input.
+
+        The result is a candidate matrix kept per action and number of candidates; it is
+        overwritten by the next call. The extra columns are only rewritten when a different
+        `extra_input` array is passed, so for fixed candidate sets (e.g. the buy and swap
+        one-hot blocks) each call just broadcasts the state into the left columns.
+        """
         self.construct_input()
-        extra_input_height = extra_input.shape[0]
-        return np.column_stack((np.repeat([self.current_input], extra_input_height, 0), extra_input))
+        key = (action, extra_input.shape[0])
+        matrix, cached_extra = self.candidates.get(key, (None, None))
+        if matrix is None or matrix.shape[1] != len(self.current_input) + extra_input.shape[1]:
+            matrix = np.empty((extra_input.shape[0], len(self.current_input) + extra_input.shape[1]), dtype=np.float32)
+            cached_extra = None
+        if extra_input is not cached_extra:
+            matrix[:, len(self.current_input):] = extra_input
+            self.candidates[key] = (matrix, extra_input)
+        matrix[:, :len(self.current_input)] = self.current_input
+        return matrix
 
     def merge_right(self, original_input, right_input):
-        """Merges the right input with the original input."""
-        input_height = original_input.shape[0]
-        return np.column_stack((original_input, np.repeat([right_input], input_height, 0)))
+        """Merges the right input with the original input, reusing a matrix per shape."""
+        height, width = original_input.shape
+        key = (height, width + len(right_input))
+        matrix = self.right_candidates.get(key)
+        if matrix is None:
+            matrix = self.right_candidates[key] = np.empty(key, dtype=np.float32)
+        matrix[:, :width] = original_input
+        matrix[:, width:] = right_input
+        return matrix
+
+    def swap_candidates(self, legal):
+        """
+        Returns the one-hot candidate rows of the `legal` trade indices.
+
+        The rows are written into a buffer kept across decisions. While the legal trades stay
+        the same the same array is returned, so `merge_input` and the evaluation cache reuse
+        its columns and digest.
+        """
+        if self.swap_legal is not None and np.array_equal(self.swap_legal, legal):
+            return self.swap_candidates_view
+        n_legal = len(legal)
+        if len(self.swap_rows) < n_legal:
+            self.swap_rows = np.zeros((max(n_legal, 2 * len(self.swap_rows)), input_sizes['swap']), dtype=np.float32)
+        rows = self.swap_rows[:n_legal]
+        if self.swap_legal is not None:
+            # clears the previous decision's ones
+            self.swap_rows[np.arange(len(self.swap_legal)), self.swap_legal] = 0
+        rows[np.arange(n_legal), legal] = 1
+        self.swap_legal = legal
+        self.swap_candidates_view = rows
+        return rows
 
     def construct_input(self):
         """Constructs input for each player state."""
         self.current_input = self.player.complete_serialize()
 
     def load(self, prefix):
+        from tensorflow.keras.models import load_model
+
+        if self.cache is not None:
+            self.cache.clear()
+        if self.trainer is not None:
+            # the loaded models are played with directly until training starts again
+            self.trainer.wait()
+            self.trainer = None
+            if self.network is not None:
+                self.models.update(self.network.heads)
+        if self.network is not None:
+            self.network.load(f"{prefix}shared_trunk_ai.weights.h5")
+            return
         for action in actions:
             self.models[action] = load_model(f"{prefix}{action}_ai.h5")
 
+    def load_numpy(self, prefix):
+        """Loads the NumPy copies written by `save` for TensorFlow-free inference."""
+        if self.cache is not None:
+            self.cache.clear()
+        for action in actions:
+            self.models[action] = NumpyModel.load(f"{prefix}{action}_ai.npz")
+
     def save(self, prefix):
+        if self.network is not None:
+            self.network.save(f"{prefix}shared_trunk_ai.weights.h5")
+            return
+        models = self.training_models()
         for action in actions:
-            self.models[action].save(f"{prefix}{action}_ai.h5")
+            models[action].save(f"{prefix}{action}_ai.h5")
+        # read back by load_numpy
+        export_models(prefix, models)
+
+    def frozen_models(self):
+        """Returns NumPy copies of the models, e.g. to send them to worker processes."""
+        if self.trainer is not None:
+            # the published copies; the learners may be halfway through a fit
+            with self.trainer.lock:
+                return dict(self.models)
+        if self.network is not None:
+            return self.network.to_numpy()
+        return {
+            action: model if isinstance(model, NumpyModel) else NumpyModel.from_keras(model)
+            for action, model in self.models.items()
+        }
 
     def create_model(self, additional_inputs):
         """Generates a generic AI model."""
+        from tensorflow.keras.layers import Dense, Dropout, Activation
+        from tensorflow.keras.models import Sequential
+        from tensorflow.keras.optimizers import SGD
+
         ai = Sequential([
             Dense(512, input_shape=(self.input_dim + additional_inputs,)),
             Dropout(0.1),
@@ -111,3 +266,56 @@ class PlayerAI:
         opt = SGD(nesterov=True, momentum=0.1)
         ai.compile(loss='categorical_crossentropy', optimizer=opt, metrics=['accuracy'])
         return ai
+
+
+def freeze_models(players):
+    """
+    Returns the NumPy copies of every player's models by player id, e.g. to send them to
+    worker processes. Shared models are converted once and appear under every id.
+    """
+    frozen = {}
+    models = {}
+    for player in players:
+        if id(player.AI.models) not in frozen:
+            frozen[id(player.AI.models)] = player.AI.frozen_models()
+        models[player.id] = frozen[id(player.AI.models)]
+    return models
+
+
+class SharedAI(object):
+    """
+    One set of models used by every player. The players' decisions are pooled here
+    after each game and the models are trained once on all of them.
+    """
+
+    def __init__(self, players, replay_capacity=DEFAULT_CAPACITY):
+        # the models belong to the first player whose agent uses them; the game shuffles its
+        # players, so the owner is kept rather than looked up by position
+        owner = next((player for player in players if player.agent.uses_ai), players[0])
+        self.owner = owner
+        self.player_id = owner.id
+        self.AI = owner.AI
+        self.replay = ReplayStore(actions, replay_capacity)
+        self.ais = [player.AI for player in players]
+        for player in players:
+            player.shared_ai = True
+            player.AI.shared = self
+            player.AI.models = self.AI.models
+            player.AI.network = self.AI.network
+            player.AI.cache = self.AI.cache
+
+    def absorb(self, players):
+        """Moves the players' recorded decisions into the shared replay store."""
+        for player in players:
+            self.replay.absorb(player.AI.replay)
+
+    def train(self):
+        self.AI.train(replay=self.replay)
+
+    def start_training(self):
+        self.AI.start_training(replay=self.replay)
+        for ai in self.ais:
+            ai.trainer = self.AI.trainer
+
+    def flush_history(self):
+        self.replay.clear()
@@ -0,0 +1,117 @@
+import numpy as np
+
+DEFAULT_CAPACITY = 50000
+
+
+class ReplayBuffer(object):
+    """
+    Fixed-capacity ring buffer of the decisions recorded for one action.
+
+    Features, win labels and turns live in preallocated arrays; once the buffer is full
+    the oldest decisions are overwritten. The arrays are allocated on the first append,
+    when the input width is known.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.features = None
+        self.labels = None
+        self.turns = None
+        self.size = 0
+        self.next = 0
+        # decisions of the current game still waiting for their win label
+        self.n_pending = 0
+
+    def allocate(self, input_dim):
+        self.features = np.zeros((self.capacity, input_dim), dtype=np.float32)
+        self.labels = np.zeros(self.capacity, dtype=np.int8)
+        self.turns = np.zeros(self.capacity, dtype=np.int32)
+
+    def append(self, features, turn):
+        if self.features is None:
+            self.allocate(features.shape[-1])
+        self.features[self.next] = features
+        self.turns[self.next] = turn
+        self.next = (self.next + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.n_pending = min(self.n_pending + 1, self.capacity)
+
+    def label_pending(self, win):
+        """Sets the win label of every decision recorded since the last call."""
+        if self.n_pending:
+            self.labels[(self.next - np.arange(1, self.n_pending + 1)) % self.capacity] = win
+            self.n_pending = 0
+
+    def extend(self, features, labels, turns):
+        """Appends labeled decisions, evicting the oldest ones if needed."""
+        n = len(labels)
+        if n == 0:
+            return
+        if self.features is None:
+            self.allocate(features.shape[1])
+        if n > self.capacity:
+            features, labels, turns = features[-self.capacity:], labels[-self.capacity:], turns[-self.capacity:]
+            n = self.capacity
+        slots = (self.next + np.arange(n)) % self.capacity
+        self.features[slots] = features
+        self.labels[slots] = labels
+        self.turns[slots] = turns
+        self.next = (self.next + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def data(self):
+        """
+        Returns:
+            Views of the stored features, labels and turns. Rows are in slot order,
+            which is not chronological once the buffer has wrapped.
+        """
+        if self.features is None:
+            return None, None, None
+        return self.features[:self.size], self.labels[:self.size], self.turns[:self.size]
+
+    def clear(self):
+        self.size = 0
+        self.next = 0
+        self.n_pending = 0
+
+    def __len__(self):
+        return self.size
+
+
+class ReplayStore(object):
+    """One ReplayBuffer per action type."""
+
+    def __init__(self, actions, capacity=DEFAULT_CAPACITY):
+        self.buffers = {action: ReplayBuffer(capacity) for action in actions}
+
+    def record(self, action, features, turn):
+        self.buffers[action].append(features, turn)
+
+    def finish_game(self, win):
+        """Labels the decisions of the game that just ended."""
+        for buffer in self.buffers.values():
+            buffer.label_pending(win)
+
+    def export(self):
+        """Returns copies of the stored decisions, e.g. to send them from a worker process."""
+        exported = {}
+        for action, buffer in self.buffers.items():
+            if len(buffer):
+                exported[action] = tuple(array.copy() for array in buffer.data())
+        return exported
+
+    def merge(self, exported):
+        """Appends decisions returned by `export`."""
+        for action, (features, labels, turns) in exported.items():
+            self.buffers[action].extend(features, labels, turns)
+
+    def absorb(self, other):
+        """Moves all decisions of another store into this one."""
+        for action, buffer in other.buffers.items():
+            if len(buffer):
+                self.buffers[action].extend(*buffer.data())
+            buffer.clear()
+
+    def clear(self):
+        for buffer in self.buffers.values():
+            buffer.clear()
@@ -0,0 +1,158 @@
+import numpy as np
+
+from numpy_model import NumpyModel
+
+EMBEDDING_SIZE = 256
+
+
+class TrunkEncoder(object):
+    """
+    Runs an encoder over the state columns of candidate rows.
+
+    Candidate rows of one decision share their state, so the encoder runs once per run of
+    identical state rows. The embedding of the last single-state call is cached and reused
+    by every head evaluated before the state changes.
+    """
+
+    def __init__(self, encode):
+        self.encode = encode
+        self.cached_state = None
+        self.cached_embedding = None
+
+    def embeddings(self, states):
+        starts = np.flatnonzero(np.concatenate(([True], np.any(states[1:] != states[:-1], axis=1))))
+        if len(starts) > 1:
+            # rows of several decisions, e.g. a batch from the InferenceBroker
+            lengths = np.diff(np.append(starts, len(states)))
+            return np.repeat(self.encode(np.asarray(states[starts], dtype=np.float32)), lengths, axis=0)
+        if self.cached_state is None or not np.array_equal(self.cached_state, states[0]):
+            self.cached_state = np.array(states[0], dtype=np.float32)
+            self.cached_embedding = self.encode(self.cached_state[None, :])
+        return np.broadcast_to(self.cached_embedding, (len(states), self.cached_embedding.shape[1]))
+
+    def clear_cache(self):
+        self.cached_state = None
+        self.cached_embedding = None
+
+
+class SharedTrunkNetwork(object):
+    """
+    One encoder over the game state with a small head per action.
+
+    The encoder (512-256) replaces the first two layers of the separate models; each
+    head sees the state embedding next to its action's extra input (128-2). Evaluating a
+    decision runs the encoder on a single state row and caches the embedding, so every
+    head evaluated before the state changes reuses it.
+    """
+
+    def __init__(self, state_dim, input_sizes):
+        from tensorflow.keras.layers import Input, Dense, Dropout, Activation, Concatenate
+        from tensorflow.keras.models import Model
+        from tensorflow.keras.optimizers import SGD
+
+        self.state_dim = state_dim
+        self.input_sizes = input_sizes
+        state = Input(shape=(state_dim,))
+        x = Dense(512)(state)
+        x = Dropout(0.1)(x)
+        x = Activation('relu')(x)
+        x = Dense(EMBEDDING_SIZE)(x)
+        x = Dropout(0.05)(x)
+        embedding = Activation('relu')(x)
+        self.encoder = Model(state, embedding)
+
+        self.heads = {}
+        self.head_models = {}
+        self.train_models = {}
+        extras = []
+        outputs = []
+        for action, size in input_sizes.items():
+            head_embedding = Input(shape=(EMBEDDING_SIZE,))
+            extra = Input(shape=(size,))
+            x = Concatenate()([head_embedding, extra])
+            x = Dense(128)(x)
+            x = Dropout(0.05)(x)
+            x = Activation('relu')(x)
+            x = Dense(2)(x)
+            output = Activation('softmax')(x)
+            self.head_models[action] = Model([head_embedding, extra], output)
+
+            train_extra = Input(shape=(size,))
+            train_model = Model(
+                [state, train_extra], self.head_models[action]([self.encoder(state), train_extra])
+            )
+            train_model.compile(
+                loss='categorical_crossentropy', optimizer=SGD(nesterov=True, momentum=0.1), metrics=['accuracy']
+            )
+            self.train_models[action] = train_model
+            self.heads[action] = TrunkHead(self, action)
+            extras.append(train_extra)
+            outputs.append(train_model.output)
+        # holds every weight once, for checkpoints
+        self.combined = Model([state] + extras, outputs)
+        self.trunk = TrunkEncoder(lambda x: np.asarray(self.encoder.predict_on_batch(x)))
+
+    def save(self, filename):
+        self.combined.save_weights(filename)
+
+    def load(self, filename):
+        self.combined.load_weights(filename)
+        self.trunk.clear_cache()
+
+    def to_numpy(self):
+        """Returns NumPy copies of every head, sharing one NumPy encoder."""
+        encoder = NumpyModel.from_keras(self.encoder)
+        trunk = TrunkEncoder(encoder.predict)
+        return {
+            action: NumpyTrunkHead(trunk, NumpyModel.from_keras(head_model), self.state_dim, encoder)
+            for action, head_model in self.head_models.items()
+        }
+
+
+class TrunkHead(object):
+    """Stands in for a per-action Keras model in `PlayerAI.models`."""
+
+    def __init__(self, network, action):
+        self.network = network
+        self.action = action
+
+    def predict(self, input_data, **kwargs):
+        state_dim = self.network.state_dim
+        embeddings = self.network.trunk.embeddings(input_data[:, :state_dim])
+        return np.asarray(self.network.head_models[self.action].predict_on_batch(
+            [np.ascontiguousarray(embeddings), input_data[:, state_dim:]]
+        ))
+
+    predict_on_batch = predict
+
+    def fit(self, x, y, **kwargs):
+        state_dim = self.network.state_dim
+        history = self.network.train_models[self.action].fit([x[:, :state_dim], x[:, state_dim:]], y, **kwargs)
+        self.network.trunk.clear_cache()
+        return history
+
+    def summary(self):
+        return self.network.train_models[self.action].summary()
+
+
+class NumpyTrunkHead(object):
+    """NumPy copy of a TrunkHead, used by worker processes."""
+
+    def __init__(self, trunk, head, state_dim, encoder=None):
+        self.trunk = trunk
+        self.head = head
+        self.state_dim = state_dim
+        # NumpyModel behind the trunk, shared by the heads of one network
+        self.encoder = encoder
+
+    def weights(self):
+        """Returns the encoder's and the head's weight arrays; call `trunk.clear_cache` after changing them."""
+        return self.encoder.weights() + self.head.weights()
+
+    def predict(self, input_data, **kwargs):
+        x = np.empty((input_data.shape[0], EMBEDDING_SIZE + input_data.shape[1] - self.state_dim), dtype=np.float32)
+        x[:, :EMBEDDING_SIZE] = self.trunk.embeddings(input_data[:, :self.state_dim])
+        x[:, EMBEDDING_SIZE:] = input_data[:, self.state_dim:]
+        return self.head.predict(x)
+
+    predict_on_batch = predict
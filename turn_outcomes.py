@@ -0,0 +1,89 @@
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from activation import ACTIVATION_MASK, TUNA_BOAT
+from income_tables import ROLL_PROBABILITIES
+
+ROLLS = range(1, 13)
+TUNA_ROLLS = frozenset(np.flatnonzero(ACTIVATION_MASK[:, TUNA_BOAT]).tolist())
+# sums of the tuna boat's two dice and their probabilities
+TUNA_SUMS = range(2, 13)
+TUNA_PROBABILITIES = ROLL_PROBABILITIES[2, 2:13]
+
+# scratch games of every thread of this process, one per number of players
+_scratch_games = {}
+
+
+def _scratch_game(n_players):
+    from game import Game
+
+    key = (n_players, threading.get_ident())
+    if key not in _scratch_games:
+        # greedy agents take the TV station's coins from the richest opponent
+        _scratch_games[key] = Game(n_players, options={'agents': ['greedy'] * n_players, 'initialize_ai': False})
+    return _scratch_games[key]
+
+
+class TurnOutcomes(namedtuple('TurnOutcomes', ['rolls', 'weights', 'deltas'])):
+    """
+    Every outcome of the cards activated by a turn's roll.
+
+    Attributes:
+        rolls: The roll of each outcome, shape (n_outcomes,).
+        weights: The probability of each outcome given its roll; a roll has one outcome, or
+            one per sum of the tuna boat's dice.
+        deltas: The change of every player's coins, shape (n_outcomes, n_players).
+    """
+
+    def roll_values(self, player_id):
+        """
+        The expected gain of `player_id` for each roll, counted as their coin delta minus the
+        mean delta of the opponents.
+
+        Returns:
+            An array of shape (MAX_ROLL + 1,); rolls that cannot happen are 0.
+        """
+        deltas = self.deltas.astype(np.float64)
+        values = deltas[:, player_id] - (deltas.sum(axis=1) - deltas[:, player_id]) / (deltas.shape[1] - 1)
+        return np.bincount(self.rolls, weights=self.weights * values, minlength=ROLL_PROBABILITIES.shape[1])
+
+
+def turn_outcomes(game, player_id):
+    """
+    Enumerates the coin deltas of `player_id` rolling each of 1 to 12 in the game's current state.
+
+    The rolls are played by `Game.activate_cards` on a scratch copy of the holdings and coins,
+    followed by the city hall's coin. The tuna boat is played once for every sum of its dice,
+    which every owner of a tuna boat rolls alike. The TV station takes from the richest opponent and the business center trades like
+    `agents.GreedyAgent`, so the live game and its decision streams are untouched.
+    """
+    scratch = _scratch_game(game.n_players)
+    state = scratch.state
+    buildings = game.state.buildings
+    coins = game.state.coins
+    n_tuna_owners = int(np.count_nonzero(buildings[:, TUNA_BOAT]))
+    rolls = []
+    weights = []
+    deltas = []
+    for roll in ROLLS:
+        if n_tuna_owners and roll in TUNA_ROLLS:
+            tuna_rolls = zip(TUNA_SUMS, TUNA_PROBABILITIES)
+        else:
+            tuna_rolls = ((None, 1.),)
+        for tuna_sum, weight in tuna_rolls:
+            state.buildings[:] = buildings
+            state.coins[:] = coins
+            if tuna_sum is not None:
+                # the dice the tuna boats roll next, the same sum for every owner
+                first_die = max(1, tuna_sum - 6)
+                scratch.rng.faces = [first_die, tuna_sum - first_die] * n_tuna_owners
+                scratch.rng.next_face = 0
+            scratch.activate_cards(player_id, roll)
+            if state.coins[player_id] == 0:
+                state.coins[player_id] = 1
+            rolls.append(roll)
+            weights.append(weight)
+            deltas.append(state.coins - coins)
+    return TurnOutcomes(np.array(rolls), np.array(weights), np.array(deltas))